@@ -0,0 +1,91 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.util import Finalize
+
+from core import config
+from core.scheduler import read_urls
+
+logger = logging.getLogger(__name__)
+
+""" Headless entry point: python batch.py urls.txt --workers 4  (or pipe the urls through stdin)"""
+
+
+def init_worker():
+    from core.singlenton.download_executor import DownloadExecutor
+    from core.singlenton.webdriver_pool import WebDriverPool
+    # quit Chrome and the download threads when the pool stops this process
+    Finalize(None, WebDriverPool.shutdown, exitpriority=10)
+    Finalize(None, DownloadExecutor.shutdown, exitpriority=10)
+    # one Prometheus file and one log per worker so the processes don't overwrite or rotate each other's files
+    config.METRICS_PROM_PATH = config.METRICS_PROM_PATH.replace('.prom', '-%d.prom' % os.getpid())
+    name, ext = os.path.splitext(config.LOG_FILE)
+    config.LOG_FILE = '%s-%d%s' % (name, os.getpid(), ext)
+
+
+def process_project(url):
+    """Scrape images, videos and project info of one project url, returns a summary dict"""
+    from core.project import scrape_project
+    return scrape_project(url)
+
+
+def print_report(summaries, elapsed):
+    print()
+    print('%-40s %-10s %7s %7s %7s %7s %12s %8s' % ('project', 'status', 'images', 'videos', 'added', 'failed',
+                                                    'bytes', 'seconds'))
+    for s in summaries:
+        print('%-40s %-10s %7d %7d %7d %7d %12d %8.1f' % ((s['project_id'] or s['url'])[:40], s['status'],
+                                                          s['images'], s['videos'], s['added'], s['failed'],
+                                                          s['bytes'], s['seconds']))
+    ok = len([s for s in summaries if s['status'] == 'ok'])
+    print('\n%d projects, %d ok, %d with errors in %.1f seconds' % (len(summaries), ok, len(summaries) - ok, elapsed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scrape many Kickstarter projects without the GUI')
+    parser.add_argument('file', nargs='?', help='file with one project url per line, stdin when omitted')
+    parser.add_argument('--workers', type=int, default=config.BATCH_WORKERS, help='number of worker processes')
+    parser.add_argument('--export', help='write every stored project to this JSONL file and exit')
+    parser.add_argument('--crawl', metavar='TERM', help='store every project of a search instead of a url list')
+    parser.add_argument('--category', type=int, help='category id to crawl, with or without --crawl')
+    parser.add_argument('--media', action='store_true', help='download the media of every crawled project')
+    parser.add_argument('--max-pages', type=int, help='stop the crawl after this many pages')
+    args = parser.parse_args(argv)
+
+    if args.export:
+        from core.singlenton.metadata_store import MetadataStore
+        print('%d projects exported to %s' % (MetadataStore().export_jsonl(args.export), args.export))
+        return 0
+
+    if args.crawl is not None or args.category:
+        from core.crawler import crawl
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(message)s')
+        start = time.time()
+        total, failed = crawl(args.crawl or '', args.category, fetch_media=args.media, max_pages=args.max_pages)
+        print('%d projects stored in %.1f seconds, %d pages failed' % (total, time.time() - start, len(failed)))
+        return 0 if not failed else 1
+
+    if args.file:
+        with open(args.file) as f:
+            urls = read_urls(f)
+    else:
+        urls = read_urls(sys.stdin)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(message)s')
+    start = time.time()
+    summaries = []
+    with multiprocessing.Pool(processes=max(1, args.workers), initializer=init_worker) as pool:
+        for summary in pool.imap_unordered(process_project, urls):
+            logger.info('%s %s' % (summary['project_id'] or summary['url'], summary['status']))
+            summaries.append(summary)
+        pool.close()
+        pool.join()
+    print_report(summaries, time.time() - start)
+    return 0 if all(s['status'] == 'ok' for s in summaries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.server import BenchmarkServer  # noqa: E402
+from core import config  # noqa: E402
+from core import downloader  # noqa: E402
+from core.singlenton.async_loop import AsyncLoop  # noqa: E402
+from core.singlenton.download_executor import DownloadExecutor  # noqa: E402
+from core.singlenton.host_limiter import HostLimiter  # noqa: E402
+from core.singlenton.http_session import HttpSession  # noqa: E402
+
+""" python benchmarks/bench_downloader.py --files 200 --size 65536 --workers 1,4,8,16 [--json out.json]"""
+
+
+def rss_mb():
+    """Current resident memory of the process, None when neither psutil nor /proc is available"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1048576
+    except ImportError:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576
+        except (OSError, ValueError, AttributeError):
+            return None
+
+
+class Sampler(threading.Thread):
+    """Peak thread count and resident memory while one case runs, ru_maxrss would keep the peak of every case"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak_threads = threading.active_count()
+        self.peak_rss = rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(0.01):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            if self.peak_rss is not None:
+                self.peak_rss = max(self.peak_rss, rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def use_workers(workers):
+    """
+    Restart the shared executor, event loop, HTTP pool and host limiter with `workers` threads / connections.
+    Every request goes to 127.0.0.1, the limits are pinned to `workers` so they don't cap a case or carry over
+    to the next one, for both engines
+    """
+    DownloadExecutor.shutdown()
+    AsyncLoop.shutdown()
+    HttpSession.close()
+    HostLimiter.reset()
+    config.DOWNLOAD_WORKERS = workers
+    config.HOST_START_CONCURRENCY = workers
+    config.HOST_MAX_CONCURRENCY = workers
+    config.HTTP_POOL_SIZE = workers + config.SEGMENT_WORKERS
+    config.ASYNC_MAX_PER_HOST = workers
+    config.ASYNC_MAX_IN_FLIGHT = workers
+
+
+def run_case(mode, urls, target):
+    if mode == 'media':
+        return downloader.get_all_media(urls, target, '', 'images')
+    if mode == 'thumbnails':
+        return downloader.get_all_thumbnails({str(i): url for i, url in enumerate(urls)}, target)
+    return {url: downloader.download(url, target) for url in urls}
+
+
+def bench(server, mode, workers, files, size):
+    use_workers(workers)
+    target = tempfile.mkdtemp(prefix='ks-bench-')
+    sampler = Sampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        results = run_case(mode, server.file_urls(files, size), target)
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        # the downloader joins paths with '\\', on POSIX that leaves siblings like <target>\images\jpg
+        for directory in glob.glob(target + '*'):
+            shutil.rmtree(directory, ignore_errors=True)
+    ok = [r for r in results.values() if r['status'] == 'ok']
+    total = sum(r['bytes'] for r in ok)
+    return {'mode': mode, 'workers': workers, 'files': files, 'size': size, 'ok': len(ok),
+            'errors': len(results) - len(ok), 'seconds': round(elapsed, 3),
+            'files_s': round(len(ok) / elapsed, 1), 'mb_s': round(total / 1048576 / elapsed, 2),
+            'peak_threads': sampler.peak_threads,
+            'peak_rss_mb': round(sampler.peak_rss, 1) if sampler.peak_rss is not None else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Downloader throughput against a local server')
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size', type=int, default=64 * 1024, help='bytes per file')
+    parser.add_argument('--workers', default='1,4,8,16', help='comma separated concurrency levels')
+    parser.add_argument('--modes', default='media,thumbnails,download', help='media, thumbnails, download')
+    parser.add_argument('--engine', default=config.DOWNLOAD_ENGINE, choices=('threads', 'asyncio'))
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--throttle', type=int, default=0, help='bytes/s per connection, 0 = unlimited')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args(argv)
+
+    # measure the network path only
+    config.HTTP_CACHE_ENABLED = False
+    config.MEDIA_STORE_ENABLED = False
+    config.DOWNLOAD_ENGINE = args.engine
+
+    server = BenchmarkServer(args.latency, args.throttle, args.error_rate).start()
+    rows = []
+    try:
+        for mode in args.modes.split(','):
+            for workers in [int(w) for w in args.workers.split(',')]:
+                row = bench(server, mode, workers, args.files, args.size)
+                rows.append(row)
+                print('%-10s workers=%-3d %6.2fs %8.1f files/s %8.2f MB/s threads=%-4d rss=%s MB errors=%d' % (
+                    mode, workers, row['seconds'], row['files_s'], row['mb_s'], row['peak_threads'],
+                    '%.0f' % row['peak_rss_mb'] if row['peak_rss_mb'] else '?', row['errors']))
+    finally:
+        server.stop()
+        DownloadExecutor.shutdown()
+        AsyncLoop.shutdown()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
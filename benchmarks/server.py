@@ -0,0 +1,115 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+""" Local stand-in for the Kickstarter CDN, /files/<name>-<size>.<ext> returns <size> synthetic bytes"""
+
+BLOCK = bytes(range(256)) * 256
+
+
+class BenchmarkServer:
+    """
+    `latency` seconds before every answer, `throttle` bytes/s per connection (0 = unlimited),
+    `error_rate` fraction of requests answered with a 503, the first `fail_first` requests are answered with one too
+    Every file has an ETag, a matching If-None-Match gets a 304
+    """
+
+    def __init__(self, latency=0.0, throttle=0, error_rate=0.0, fail_first=0, retry_after='1'):
+        self.latency = latency
+        self.throttle = throttle
+        self.error_rate = error_rate
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        self.ranges = []
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_address[1]
+
+    def file_urls(self, count, size, ext='jpg'):
+        return [self.url + '/files/%d-%d.%s' % (i, size, ext) for i in range(count)]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET(body=False)
+
+            def do_GET(self, body=True):
+                range_header = self.headers.get('Range')
+                with server.lock:
+                    server.requests += 1
+                    failed = server.requests <= server.fail_first
+                    server.ranges.append(range_header)
+                if server.latency:
+                    time.sleep(server.latency)
+                if failed or server.error_rate and random.random() < server.error_rate:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.send_header('Retry-After', server.retry_after)
+                    self.end_headers()
+                    return
+                try:
+                    size = int(self.path.split('?')[0].rsplit('/', 1)[-1].split('.')[0].split('-')[-1])
+                except ValueError:
+                    self.send_error(404)
+                    return
+                etag = '"%d"' % size
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                start, end = 0, size - 1
+                if range_header:
+                    first, _, last = range_header.split('=')[-1].partition('-')
+                    start = int(first)
+                    end = int(last) if last else size - 1
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header('Content-Range', 'bytes */%d' % size)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', etag)
+                self.end_headers()
+                if body:
+                    self.send_body(start, end - start + 1)
+
+            def send_body(self, offset, remaining):
+                # byte n of a file is n % 256 whatever the range, so a resumed file matches a whole one
+                while remaining > 0:
+                    chunk = BLOCK[offset % 256:][:remaining]
+                    self.wfile.write(chunk)
+                    offset += len(chunk)
+                    remaining -= len(chunk)
+                    if server.throttle:
+                        time.sleep(len(chunk) / server.throttle)
+
+        return Handler
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+import requests
+
+from core import config
+from core.downloader import resolve_file_name, build_result, unchanged_result, record_result, target_filename, \
+    from_media_store, revalidation_headers, use_segments, fetch_segmented, finish, resume_headers, \
+    range_not_satisfiable, write_mode, check_part, check_retry_after
+from core.singlenton.async_loop import AsyncLoop
+from core.singlenton.host_limiter import THROTTLED
+from core.singlenton.logger import Logger
+from core.singlenton.metrics import Metrics
+
+logger = Logger()
+
+""" asyncio alternative to the threaded downloader, enabled with KS_DOWNLOAD_ENGINE=asyncio"""
+
+
+def submit(url, path, version='', media_type='', progress=None, manifest=None):
+    """
+    Same as DownloadExecutor().submit(download, ...) of core.downloader but the download runs on the
+    process wide event loop and session. Returns a concurrent.futures.Future with the result of `download()`
+    """
+    engine = AsyncLoop()
+    return engine.submit(download(engine.session, url, path, version, media_type, progress, manifest))
+
+
+async def download(session, url, pathname, version='', media_type='', progress=None, manifest=None):
+    """
+    core.downloader.download on the event loop: same .part resume, If-Range, Content-Length check,
+    HTTP cache, media store, manifest and metrics. Files of SEGMENT_EXTENSIONS still use the threaded
+    segmented download, the per host limit is the connector's ASYNC_MAX_PER_HOST instead of the HostLimiter
+    """
+    start = time.time()
+    result = unchanged_result(url, manifest)
+    if result is not None:
+        return result
+    result = await fetch_file(session, url, pathname, media_type, progress)
+    # hashing for the manifest would block the loop
+    return await asyncio.to_thread(record_result, result, manifest, start)
+
+
+async def fetch_file(session, url, pathname, media_type='', progress=None):
+    filename = None
+    size = 0
+    try:
+        filename = target_filename(url, pathname, media_type)
+        part_filename = filename + '.part'
+        cached = await asyncio.to_thread(from_media_store, url, filename)
+        if cached is not None:
+            return cached
+        validators = revalidation_headers(url, filename)
+
+        if use_segments(url, part_filename, validators):
+            segments = await asyncio.to_thread(fetch_segmented, url, part_filename, progress)
+            if segments is not None:
+                size, headers = segments
+                return await asyncio.to_thread(finish, url, part_filename, filename, size, headers)
+
+        for attempt in range(config.HTTP_RETRIES + 1):
+            try:
+                size, complete, response = await fetch_part(session, url, part_filename, validators, progress)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                logger.warn('Download of ' + resolve_file_name(url) + ' interrupted, resuming -> ' + str(e))
+                Metrics().inc('download_retries')
+                continue
+            if response.status in THROTTLED:
+                wait = check_retry_after(url, response.headers)
+                logger.warn(resolve_file_name(url) + ' throttled with ' + str(response.status) + ', retrying')
+                Metrics().inc('download_retries')
+                await asyncio.sleep(wait)
+                continue
+            if response.status == 304:
+                logger.debug(msg=resolve_file_name(url) + ' not modified')
+                return build_result(url, filename, os.path.getsize(filename), 'not_modified')
+            if complete:
+                # the media store hashes the file
+                return await asyncio.to_thread(finish, url, part_filename, filename, size, response.headers)
+        logger.error('Unable to complete ' + str(url) + ', partial file kept in ' + part_filename)
+        return build_result(url, filename, size, 'error')
+    # the segmented download and RetryAfterTooLong raise requests errors
+    except (aiohttp.ClientError, requests.exceptions.RequestException, OSError) as e:
+        logger.error('Error downloading ' + str(url) + ' -> ' + str(e))
+        return build_result(url, filename, size, 'error')
+
+
+async def fetch_part(session, url, part_filename, validators=None, progress=None):
+    """core.downloader.fetch_part with aiohttp, returns the size, whether it is complete and the response"""
+    offset, headers = resume_headers(part_filename, validators)
+    async with session.get(url, headers=headers) as response:
+        if response.status in THROTTLED:
+            return offset, False, response
+        if response.status == 304:
+            return 0, False, response
+        if response.status == 416 and offset:
+            complete = range_not_satisfiable(url, part_filename, offset, response.headers)
+            return offset if complete else 0, complete, response
+        response.raise_for_status()
+
+        offset, mode = write_mode(part_filename, offset, response.status, response.headers)
+        expected = offset + response.content_length if response.content_length is not None else None
+        if progress is not None and response.content_length is not None:
+            progress.expect(response.content_length)
+        size = offset
+        with open(part_filename, mode) as f:
+            async for data in response.content.iter_chunked(config.DOWNLOAD_CHUNK_SIZE):
+                f.write(data)
+                size += len(data)
+                if progress is not None:
+                    progress.update(len(data))
+    return check_part(part_filename, size, expected, response)
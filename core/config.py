@@ -0,0 +1,125 @@
+import os
+
+""" Runtime settings, every value can be overridden with an environment variable"""
+
+
+def _int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Number of threads shared by every get_all_media / get_all_thumbnails call
+DOWNLOAD_WORKERS = _int('KS_DOWNLOAD_WORKERS', 8)
+
+# Shared HTTP session, HTTP_POOL_HOSTS is the number of hosts kept in the pool and
+# HTTP_POOL_SIZE (set after the host limits below) the number of keep-alive connections per host
+HTTP_POOL_HOSTS = _int('KS_HTTP_POOL_HOSTS', 10)
+HTTP_RETRIES = _int('KS_HTTP_RETRIES', 3)
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_TIMEOUT = _int('KS_HTTP_TIMEOUT', 30)
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) ' \
+             'Chrome/50.0.2661.102 Safari/537.36'
+
+# Engine used by get_all_media: 'threads' (DownloadExecutor) or 'asyncio' (core.async_downloader)
+DOWNLOAD_ENGINE = os.environ.get('KS_DOWNLOAD_ENGINE', 'threads')
+# asyncio engine limits, requests in flight for the whole process and per host
+ASYNC_MAX_IN_FLIGHT = _int('KS_ASYNC_MAX_IN_FLIGHT', 100)
+ASYNC_MAX_PER_HOST = _int('KS_ASYNC_MAX_PER_HOST', 8)
+
+# Content addressed media store shared by every project, disabled by default
+MEDIA_STORE_ENABLED = os.environ.get('KS_MEDIA_STORE', '0') == '1'
+MEDIA_STORE_PATH = os.environ.get('KS_MEDIA_STORE_PATH', os.path.join(os.path.abspath(os.getcwd()), 'store'))
+
+# Conditional GET cache (ETag / Last-Modified) for media and API calls
+HTTP_CACHE_ENABLED = os.environ.get('KS_HTTP_CACHE', '1') == '1'
+HTTP_CACHE_PATH = os.environ.get('KS_HTTP_CACHE_PATH', os.path.join(os.path.abspath(os.getcwd()), 'cache', 'http'))
+
+# Worker processes used by batch.py, each one owns a Chrome instance
+BATCH_WORKERS = _int('KS_BATCH_WORKERS', 2)
+
+# Projects scraped at the same time by the GUI job scheduler, each running job leases a pooled Chrome
+SCHEDULER_WORKERS = _int('KS_SCHEDULER_WORKERS', 2)
+
+# Lazy loaded images: max seconds waiting for one image after scrolling to it and for the whole page
+IMAGE_LOAD_TIMEOUT = float(os.environ.get('KS_IMAGE_LOAD_TIMEOUT', 2))
+PAGE_IMAGES_TIMEOUT = float(os.environ.get('KS_PAGE_IMAGES_TIMEOUT', 20))
+
+# Parse the project page over plain HTTP first, Chrome is only used when it finds nothing
+HTML_FAST_PATH = os.environ.get('KS_HTML_FAST_PATH', '1') == '1'
+
+# Pool of Chrome instances leased by PageScrap, a driver is restarted after WEBDRIVER_MAX_PAGES pages
+WEBDRIVER_POOL_SIZE = _int('KS_WEBDRIVER_POOL_SIZE', 2)
+WEBDRIVER_MAX_PAGES = _int('KS_WEBDRIVER_MAX_PAGES', 20)
+WEBDRIVER_HEADLESS = os.environ.get('KS_WEBDRIVER_HEADLESS', '1') == '1'
+
+# Write path: bytes read per chunk and whether the .part file is preallocated from Content-Length
+DOWNLOAD_CHUNK_SIZE = _int('KS_DOWNLOAD_CHUNK_SIZE', 256 * 1024)
+DOWNLOAD_PREALLOCATE = os.environ.get('KS_DOWNLOAD_PREALLOCATE', '0') == '1'
+
+# Prometheus text file rewritten after every project, point node_exporter's textfile collector at it
+METRICS_PROM_PATH = os.environ.get('KS_METRICS_PROM_PATH', os.path.join(os.path.abspath(os.getcwd()), 'metrics.prom'))
+
+# SQLite database with every scraped project and creator
+METADATA_DB_PATH = os.environ.get('KS_METADATA_DB', os.path.join(os.path.abspath(os.getcwd()), 'metadata.db'))
+
+# Search / category crawler: pages fetched at once and max requests per second to the API, a page is retried
+# CRAWL_PAGE_RETRIES times with backoff and the crawl gives up after CRAWL_MAX_FAILED_PAGES failed pages in a row
+CRAWL_WORKERS = _int('KS_CRAWL_WORKERS', 4)
+CRAWL_RATE = float(os.environ.get('KS_CRAWL_RATE', 2))
+CRAWL_PAGE_RETRIES = _int('KS_CRAWL_PAGE_RETRIES', 4)
+CRAWL_MAX_FAILED_PAGES = _int('KS_CRAWL_MAX_FAILED_PAGES', 3)
+# with fetch_media the projects' media is downloaded by CRAWL_MEDIA_WORKERS threads while the pages keep coming,
+# at most CRAWL_MEDIA_BACKLOG projects wait for them before the crawl stops scheduling pages
+CRAWL_MEDIA_WORKERS = _int('KS_CRAWL_MEDIA_WORKERS', 2)
+CRAWL_MEDIA_BACKLOG = _int('KS_CRAWL_MEDIA_BACKLOG', 20)
+
+# Memoized API lookups: entries kept in memory, seconds each endpoint stays fresh and optional disk tier
+API_CACHE_SIZE = _int('KS_API_CACHE_SIZE', 512)
+API_TTL_PROJECT = _int('KS_API_TTL_PROJECT', 10 * 60)
+API_TTL_CREATOR = _int('KS_API_TTL_CREATOR', 24 * 60 * 60)
+API_CACHE_DISK = os.environ.get('KS_API_CACHE_DISK', '0') == '1'
+API_CACHE_PATH = os.environ.get('KS_API_CACHE_PATH', os.path.join(os.path.abspath(os.getcwd()), 'cache', 'api'))
+
+# Adaptive (AIMD) concurrency per host for download(), starts at HOST_START_CONCURRENCY requests
+HOST_MIN_CONCURRENCY = _int('KS_HOST_MIN_CONCURRENCY', 1)
+HOST_MAX_CONCURRENCY = _int('KS_HOST_MAX_CONCURRENCY', 16)
+HOST_START_CONCURRENCY = _int('KS_HOST_START_CONCURRENCY', 4)
+# longest Retry-After honored, a file throttled for longer fails instead of parking every thread of the host
+HOST_MAX_RETRY_AFTER = _int('KS_HOST_MAX_RETRY_AFTER', 60)
+# a response slower than HOST_LATENCY_FACTOR times the host's average counts as congestion
+HOST_LATENCY_FACTOR = float(os.environ.get('KS_HOST_LATENCY_FACTOR', 3))
+
+# Files of these extensions bigger than SEGMENT_THRESHOLD are fetched as SEGMENT_SIZE ranges in parallel
+SEGMENT_EXTENSIONS = ('mp4', 'webm', 'mov', 'm4v')
+SEGMENT_THRESHOLD = _int('KS_SEGMENT_THRESHOLD', 16 * 1024 * 1024)
+SEGMENT_SIZE = _int('KS_SEGMENT_SIZE', 8 * 1024 * 1024)
+SEGMENT_WORKERS = _int('KS_SEGMENT_WORKERS', 4)
+
+# every request the host limiter lets through plus the segment HEAD and API calls must find a pooled
+# connection, a smaller pool discards the extra connections instead of keeping them alive
+HTTP_POOL_SIZE = _int('KS_HTTP_POOL_SIZE', max(DOWNLOAD_WORKERS, HOST_MAX_CONCURRENCY) + SEGMENT_WORKERS)
+
+# downloader.log: rotated every LOG_MAX_BYTES, LOG_LEVELS like "core.downloader=INFO,urllib3=WARNING"
+LOG_FILE = os.environ.get('KS_LOG_FILE', 'downloader.log')
+LOG_MAX_BYTES = _int('KS_LOG_MAX_BYTES', 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = _int('KS_LOG_BACKUP_COUNT', 5)
+LOG_LEVEL = os.environ.get('KS_LOG_LEVEL', 'DEBUG')
+LOG_LEVELS = os.environ.get('KS_LOG_LEVELS', 'urllib3=WARNING,selenium=INFO')
+LOG_JSON = os.environ.get('KS_LOG_JSON', '0') == '1'
+
+# GUI console: lines kept in the widget, records and seconds spent rendering per 100ms tick
+CONSOLE_MAX_LINES = _int('KS_CONSOLE_MAX_LINES', 2000)
+CONSOLE_MAX_RECORDS = _int('KS_CONSOLE_MAX_RECORDS', 500)
+CONSOLE_TICK_BUDGET = float(os.environ.get('KS_CONSOLE_TICK_BUDGET', 0.03))
+
+# Image urls: query params dropped (a trailing * matches a prefix), urls with a host label, path segment or file
+# name equal to a skip pattern or declared at most MEDIA_MIN_SIZE pixels are not downloaded,
+# SRCSET_POLICY is largest, smallest or a max width like 1024
+MEDIA_STRIP_PARAMS = tuple(os.environ.get('KS_MEDIA_STRIP_PARAMS', 'utm_*,fbclid,gclid,mc_cid,mc_eid,ref,ref_')
+                           .split(','))
+MEDIA_SKIP_PATTERNS = tuple(os.environ.get('KS_MEDIA_SKIP_PATTERNS',
+                                           'avatars,avatar,pixel,favicon,spacer,beacon').split(','))
+MEDIA_MIN_SIZE = _int('KS_MEDIA_MIN_SIZE', 2)
+SRCSET_POLICY = os.environ.get('KS_SRCSET_POLICY', 'largest')
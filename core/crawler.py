@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlencode
+
+import requests
+
+from core import config
+from core.downloader import get_all_thumbnails
+from core.kickstarter_service import get_json
+from core.manifest import Manifest
+from core.project import build_object_project, get_project_path, download_images, download_videos, ProjectPage, \
+    report_added
+from core.singlenton.download_executor import ContextExecutor
+from core.singlenton.metadata_store import MetadataStore
+
+logger = logging.getLogger(__name__)
+
+DISCOVER_URL = 'https://www.kickstarter.com/discover/advanced?'
+
+
+class RateLimiter:
+    """Spaces the calls to wait() at least 1 / `per_second` seconds apart, shared by every thread"""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second > 0 else 0
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            start = max(self.next, now)
+            self.next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def page_url(term, category_id, sort, page):
+    params = {'term': term, 'sort': sort, 'page': page, 'format': 'json'}
+    if category_id:
+        params['category_id'] = category_id
+    return DISCOVER_URL + urlencode(params)
+
+
+def fetch_page(url, limiter):
+    """
+    Returns the projects of a discover page and its has_more flag, or None when the page still fails
+    after CRAWL_PAGE_RETRIES retries: an error, a throttled answer or a body without `projects`
+    """
+    for attempt in range(config.CRAWL_PAGE_RETRIES + 1):
+        if attempt:
+            time.sleep(config.HTTP_BACKOFF_FACTOR * (2 ** attempt))
+        limiter.wait()
+        try:
+            body = get_json(url, 'discover')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning('Unable to fetch ' + url + ' -> ' + str(e))
+            continue
+        if isinstance(body, dict) and isinstance(body.get('projects'), list):
+            return body['projects'], body.get('has_more', False)
+        logger.warning('Unexpected answer for ' + url + ', retrying')
+    logger.error('Giving up ' + url + ' after ' + str(config.CRAWL_PAGE_RETRIES + 1) + ' attempts')
+    return None
+
+
+def crawl(term='', category_id=None, sort='newest', fetch_media=False, max_pages=None,
+          workers=config.CRAWL_WORKERS, rate=config.CRAWL_RATE):
+    """
+    Walks every page of a search or category, each page is saved in the MetadataStore as soon as it arrives.
+    Up to `workers` pages are fetched at once, never more than `rate` requests per second.
+    With `fetch_media` the thumbnails, images and videos of every project are downloaded too, by a separate
+    pool of CRAWL_MEDIA_WORKERS threads so the pages keep being scheduled, the crawl returns once they finish.
+    The crawl ends on a page answered with has_more false, a page that keeps failing is skipped and counted,
+    CRAWL_MAX_FAILED_PAGES failed pages in a row stop it.
+    Returns the number of projects stored and the list of failed page numbers
+    """
+    limiter = RateLimiter(rate)
+    store = MetadataStore()
+    pending = {}
+    next_page = 1
+    done = False
+    total = 0
+    failed = []
+    failed_in_row = 0
+    last_page = None
+    media = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crawler') as executor, \
+            ContextExecutor(max_workers=config.CRAWL_MEDIA_WORKERS, thread_name_prefix='crawler-media') as media_pool:
+        while True:
+            while not done and len(pending) < workers:
+                if max_pages is not None and next_page > max_pages:
+                    done = True
+                    break
+                url = page_url(term, category_id, sort, next_page)
+                pending[executor.submit(fetch_page, url, limiter)] = next_page
+                next_page += 1
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                page = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    failed.append(page)
+                    failed_in_row += 1
+                    if failed_in_row >= config.CRAWL_MAX_FAILED_PAGES:
+                        logger.error('%d pages failed in a row, stopping the crawl' % failed_in_row)
+                        done = True
+                    continue
+                failed_in_row = 0
+                projects, has_more = result
+                if not has_more:
+                    # later pages already requested come back empty and are ignored
+                    done = True
+                    last_page = min(page, last_page or page)
+                total += store_page(store, projects)
+                logger.info('Page %d: %d projects, %d stored so far' % (page, len(projects), total))
+                if fetch_media:
+                    for project in projects:
+                        if len(media) >= config.CRAWL_MEDIA_BACKLOG:
+                            media = wait(media, return_when=FIRST_COMPLETED).not_done
+                        media.add(media_pool.submit(download_project_media, project))
+    failed = [page for page in failed if last_page is None or page < last_page]
+    if failed:
+        logger.error('%d pages failed: %s' % (len(failed), ', '.join(str(page) for page in sorted(failed))))
+    return total, sorted(failed)
+
+
+def store_page(store, projects):
+    records = []
+    for project in projects:
+        try:
+            records.append((build_object_project(project), project.get('id'),
+                            project.get('creator', {}).get('name')))
+        except KeyError as e:
+            logger.error('Skipping project without ' + str(e))
+    if records:
+        store.upsert_projects(records)
+    return len(records)
+
+
+def download_project_media(project):
+    try:
+        path = get_project_path(project['slug'])
+        get_all_thumbnails(project['photo'], path + 'video\\thumbnails', Manifest.open(path))
+        page = ProjectPage(project['urls']['web']['project'])
+        try:
+            download_images(path, page)
+            download_videos(path, page)
+            report_added(path)
+        finally:
+            page.close()
+            Manifest.close(path)
+    except Exception as e:
+        logger.error('Error downloading media of ' + str(project.get('slug')) + ' -> ' + str(e))
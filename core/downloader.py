@@ -1,15 +1,20 @@
 import json
 import logging
 import os
-import threading
-from queue import Queue
+import time
+from concurrent.futures import as_completed
 
 import requests
-from requests.adapters import HTTPAdapter
-from tqdm import tqdm
-from urllib3 import Retry
 
+from core import config
+from core.progress import ProgressReporter
+from core.singlenton.download_executor import DownloadExecutor, ContextExecutor
+from core.singlenton.host_limiter import HostLimiter, THROTTLED, retry_seconds
+from core.singlenton.http_cache import HttpCache
+from core.singlenton.http_session import HttpSession
 from core.singlenton.logger import Logger
+from core.singlenton.media_store import MediaStore, link
+from core.singlenton.metrics import Metrics
 
 logger = Logger()
 
@@ -23,117 +28,455 @@ def get_ext(url):
     return file
 
 
-def get_all_media(files, path, version='', media_type=''):
-    input_queue = Queue()
-    result_hash = {}
-    cache = {}
-
-    class DownloadFileThread(threading.Thread):
-        def __init__(self, input_queue, result_hash):
-            super().__init__()
-            self.input_queue = input_queue
-            self.result_hash = result_hash
-
-        def run(self):
-            while True:
-                file_queue = self.input_queue.get()
-                download(file_queue, path, version, media_type)
-                self.input_queue.task_done()
-
-    # Start 20 Threads, all are waiting in run -> self.input_queue.get()
-    for i in files:
-        thread = DownloadFileThread(input_queue, result_hash)
-        thread.setDaemon(True)
-        thread.start()
-
-    # Fill the input queue
+def get_all_media(files, path, version='', media_type='', manifest=None):
+    """
+    Downloads every url in `files` using the shared download executor, or the asyncio engine
+    when KS_DOWNLOAD_ENGINE is 'asyncio'. Urls already in the project `manifest` are skipped.
+    Returns a dict url -> result of `download()`
+    """
+    files = list(dict.fromkeys(files))
+    progress = ProgressReporter('Downloading ' + (media_type or 'media'), len(files))
+    futures = {}
     for file in files:
-        input_queue.put(file)
+        futures[file] = submit(file, path, version, media_type, progress, manifest)
+        futures[file].add_done_callback(progress.file_done)
+    return collect_results(futures, progress, manifest)
 
-    input_queue.join()
-    cache.update(result_hash)
-    return result_hash
+
+def get_all_media_stream(files, path, version='', media_type='', manifest=None):
+    """
+    Same as get_all_media but `files` can be a generator, every url is queued on the shared executor
+    (or the shared event loop of the asyncio engine) as soon as it is produced instead of after the whole list is known
+    """
+    progress = ProgressReporter('Downloading ' + (media_type or 'media'))
+    futures = {}
+    for file in files:
+        if file in futures:
+            continue
+        progress.add_file()
+        futures[file] = submit(file, path, version, media_type, progress, manifest)
+        futures[file].add_done_callback(progress.file_done)
+    return collect_results(futures, progress, manifest)
+
+
+def get_all_thumbnails(thumbnails, path, manifest=None):
+    """
+    Downloads every thumbnail of the `thumbnails` dict (name -> url) using the shared download executor.
+    Returns a dict name -> result of `download()`
+    """
+    names = [thumbnail for thumbnail in thumbnails if thumbnail != 'key']
+    progress = ProgressReporter('Downloading thumbnails', len(names))
+    futures = {}
+    for thumbnail in names:
+        futures[thumbnail] = submit(thumbnails[thumbnail], path + '\\' + thumbnail, progress=progress,
+                                    manifest=manifest)
+        futures[thumbnail].add_done_callback(progress.file_done)
+    return collect_results(futures, progress, manifest)
+
+
+def submit(url, path, version='', media_type='', progress=None, manifest=None):
+    """
+    Queue download() on the shared executor, or on the shared event loop when KS_DOWNLOAD_ENGINE is 'asyncio'.
+    Returns a concurrent.futures.Future either way
+    """
+    if config.DOWNLOAD_ENGINE == 'asyncio':
+        from core import async_downloader
+        return async_downloader.submit(url, path, version, media_type, progress, manifest)
+    return DownloadExecutor().submit(download, url, path, version, media_type, progress, manifest)
 
 
-def get_all_thumbnails(thumbnails, path):
-    input_queue = Queue()
+def collect_results(futures, progress=None, manifest=None):
     result_hash = {}
-    cache = {}
-
-    class DownloadThumbnailsThread(threading.Thread):
-        def __init__(self, input_queue, result_hash):
-            super().__init__()
-            self.input_queue = input_queue
-            self.result_hash = result_hash
-
-        def run(self):
-            while True:
-                thumbnail_queue = self.input_queue.get()
-                download(url=thumbnail_queue[1],
-                         pathname=path + '\\' + thumbnail_queue[0])
-                self.input_queue.task_done()
-
-    # Start 20 Threads, all are waiting in run -> self.input_queue.get()
-    for i in thumbnails:
-        thread = DownloadThumbnailsThread(input_queue, result_hash)
-        thread.setDaemon(True)
-        thread.start()
-
-    # Fill the input queue
-    for thumbnail in thumbnails:
-        if thumbnail != 'key':
-            input_queue.put([thumbnail, thumbnails[thumbnail]])
-
-    input_queue.join()
-    cache.update(result_hash)
+    for key, future in futures.items():
+        try:
+            result_hash[key] = future.result()
+        except Exception as e:
+            logger.error('Unexpected error downloading ' + str(key) + ' -> ' + str(e))
+            result_hash[key] = build_result(key, None, 0, 'error')
+    if progress is not None:
+        progress.close()
+    if manifest is not None:
+        manifest.save()
     return result_hash
 
 
-def download(url, pathname, version='', media_type=''):
+def count_status(results):
+    """Number of results per status, e.g. {'ok': 3, 'unchanged': 10}"""
+    counts = {}
+    for result in results.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return counts
+
+
+def build_result(url, path, size, status):
+    return {"url": url, "path": path, "bytes": size, "status": status}
+
+
+def download(url, pathname, version='', media_type='', progress=None, manifest=None):
     """
     Downloads a file given an URL and puts it in the folder `pathname`
+    The body is written to `<name>.part` and renamed once complete, an interrupted download
+    is resumed with a Range request on the next attempt or the next call
+    When the media store is enabled a url already stored is linked instead of downloaded
+    A file already on disk is revalidated with If-None-Match / If-Modified-Since and kept on 304
+    Returns a dict with the url, the saved path, the bytes written and the status
+    ('ok', 'cached', 'not_modified', 'unchanged' or 'error'), bytes received are added to the `progress` reporter
+    A url of the project `manifest` whose file is still complete is 'unchanged' and not requested,
+    unless the HTTP cache has validators to check it cheaply with a conditional GET
     """
+    start = time.time()
+    result = unchanged_result(url, manifest)
+    if result is not None:
+        return result
+    result = fetch_file(url, pathname, media_type, progress)
+    return record_result(result, manifest, start)
+
+
+def unchanged_result(url, manifest):
+    """The 'unchanged' result of a manifest url that needs no request at all, None otherwise"""
+    entry = manifest.unchanged(url) if manifest is not None else None
+    if entry is not None and not (config.HTTP_CACHE_ENABLED and HttpCache().conditional_headers(url)):
+        return build_result(url, entry['path'], entry['size'], 'unchanged')
+    return None
+
+
+def record_result(result, manifest, start):
+    """Remember a fetched file in the project `manifest` and the metrics, returns `result`"""
+    if manifest is not None and result['status'] in ('ok', 'cached', 'not_modified'):
+        manifest.record(result)
+    metrics = Metrics()
+    metrics.inc('download_files', status=result['status'])
+    metrics.inc('download_bytes', result['bytes'])
+    metrics.observe('download', time.time() - start, status=result['status'])
+    return result
+
+
+def fetch_file(url, pathname, media_type='', progress=None):
+    filename = None
+    size = 0
     try:
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) '
-                          'Chrome/50.0.2661.102 Safari/537.36'}
-
-        # if media type is images then separate each one by extension
-        if media_type == 'images':
-            pathname += '\\images\\' + get_ext(url)
-
-        # if path doesn't exist, make that path dir
-        if not os.path.isdir(pathname):
-            os.makedirs(pathname, exist_ok=True)
-        # download the body of response by chunk, not immediately
-        response = session.get(url, headers=headers)
-
-        # get the total file size
-        file_size = int(response.headers.get("Content-Length", 0))
-
-        # get the file name
-        filename = os.path.join(pathname, resolve_file_name(url))
-
-        # progress bar, changing the unit to bytes instead of iteration (default by tqdm)
-        progress = tqdm(response.iter_content(1024),
-                        f"Downloading {resolve_file_name(url)} version {version}", total=file_size, unit="B",
-                        unit_scale=True, unit_divisor=1024)
-        logger.info(progress)
-
-        with open(filename, "wb") as f:
-            for data in progress:
-                # write data read to the file
-                f.write(data)
-                # update the progress bar manually
-                progress.update(len(data))
-        logger.info(msg='Saved in ' + pathname)
-    except ConnectionError as e:
-        logger.error(e)
+        filename = target_filename(url, pathname, media_type)
+        part_filename = filename + '.part'
+        cached = from_media_store(url, filename)
+        if cached is not None:
+            return cached
+        validators = revalidation_headers(url, filename)
+        segmented = use_segments(url, part_filename, validators)
+
+        for attempt in range(config.HTTP_RETRIES + 1):
+            try:
+                if segmented:
+                    segments = fetch_segmented(url, part_filename, progress)
+                    if segments is not None:
+                        size, headers = segments
+                        return finish(url, part_filename, filename, size, headers)
+                    segmented = False
+                size, complete, response = fetch_part(url, part_filename, validators, progress)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                logger.warn('Download of ' + resolve_file_name(url) + ' interrupted, resuming -> ' + str(e))
+                Metrics().inc('download_retries')
+                continue
+            if response.status_code in THROTTLED:
+                check_retry_after(url, response.headers)
+                logger.warn(resolve_file_name(url) + ' throttled with ' + str(response.status_code) + ', retrying')
+                Metrics().inc('download_retries')
+                continue
+            if response.status_code == 304:
+                logger.debug(msg=resolve_file_name(url) + ' not modified')
+                return build_result(url, filename, os.path.getsize(filename), 'not_modified')
+            if complete:
+                return finish(url, part_filename, filename, size, response.headers)
+        logger.error('Unable to complete ' + str(url) + ', partial file kept in ' + part_filename)
+        return build_result(url, filename, size, 'error')
+    except (requests.exceptions.RequestException, OSError) as e:
+        logger.error(str(e))
+        return build_result(url, filename, size, 'error')
+
+
+def target_filename(url, pathname, media_type=''):
+    """File `url` is saved to in the folder `pathname`, the folder is created"""
+    # if media type is images then separate each one by extension
+    if media_type == 'images':
+        pathname += '\\images\\' + get_ext(url)
+
+    # if path doesn't exist, make that path dir
+    if not os.path.isdir(pathname):
+        os.makedirs(pathname, exist_ok=True)
+
+    # get the file name
+    return os.path.join(pathname, resolve_file_name(url))
+
+
+def from_media_store(url, filename):
+    """Link the blob already stored for `url` to `filename`, returns its 'cached' result or None"""
+    if config.MEDIA_STORE_ENABLED:
+        blob = MediaStore().lookup(url)
+        if blob:
+            link(blob, filename)
+            logger.debug(msg=resolve_file_name(url) + ' linked from media store')
+            return build_result(url, filename, os.path.getsize(filename), 'cached')
+    return None
+
+
+def revalidation_headers(url, filename):
+    """If-None-Match / If-Modified-Since for a complete previous copy of `filename`, a 304 keeps it"""
+    # only revalidate when the previous copy is complete, otherwise a 304 would leave nothing on disk
+    if config.HTTP_CACHE_ENABLED and os.path.exists(filename) and not os.path.exists(filename + '.part'):
+        return HttpCache().conditional_headers(url)
+    return {}
+
+
+def use_segments(url, part_filename, validators):
+    # a segmented .part is preallocated, it can only be resumed segment by segment
+    return os.path.exists(part_filename + '.segments') or (
+        not validators and get_ext(url).lower() in config.SEGMENT_EXTENSIONS)
+
+
+def finish(url, part_filename, filename, size, headers):
+    """Move the complete .part file to `filename` and remember it in the HTTP cache and media store"""
+    os.replace(part_filename, filename)
+    remove_part(part_filename)
+    if config.HTTP_CACHE_ENABLED:
+        HttpCache().store(url, headers)
+    if config.MEDIA_STORE_ENABLED:
+        MediaStore().add(url, filename)
+    logger.debug(msg='Saved in ' + os.path.dirname(filename))
+    return build_result(url, filename, size, 'ok')
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class RetryAfterTooLong(requests.exceptions.RequestException):
+    pass
+
+
+def check_retry_after(url, headers):
+    """Seconds to wait before retrying a throttled url, raises RetryAfterTooLong past HOST_MAX_RETRY_AFTER"""
+    wait = retry_seconds(headers.get('Retry-After'))
+    if wait > config.HOST_MAX_RETRY_AFTER:
+        raise RetryAfterTooLong(resolve_file_name(url) + ' throttled for ' + str(int(wait)) + 's, giving up')
+    return wait
+
+
+def fetch_segmented(url, part_filename, progress=None):
+    """
+    Downloads `url` as SEGMENT_SIZE byte ranges fetched in parallel and written in place in the preallocated
+    `part_filename`, finished segments are listed in `<part>.segments` so an interrupted file resumes.
+    Returns the size and the validator headers, or None when the file is small or the server has no ranges
+    """
+    state_filename = part_filename + '.segments'
+    state = None
+    if os.path.exists(state_filename) and os.path.exists(part_filename):
+        try:
+            with open(state_filename) as f:
+                state = json.load(f)
+        except ValueError:
+            state = None
+    if state is None:
+        head = HttpSession().head(url, allow_redirects=True, timeout=config.HTTP_TIMEOUT)
+        total = int(head.headers.get('Content-Length', 0))
+        if head.status_code != 200 or head.headers.get('Accept-Ranges') != 'bytes' or total < config.SEGMENT_THRESHOLD:
+            remove_segments(state_filename)
+            return None
+        state = {'size': total, 'done': [],
+                 'headers': {key: head.headers[key] for key in ('ETag', 'Last-Modified') if key in head.headers}}
+        with open(part_filename, 'wb') as f:
+            f.truncate(total)
+        save_segments(state_filename, state)
+
+    total = state['size']
+    pending = [start for start in range(0, total, config.SEGMENT_SIZE) if start not in state['done']]
+    if progress is not None:
+        progress.expect(sum(min(config.SEGMENT_SIZE, total - start) for start in pending))
+    try:
+        fetch_segments(url, part_filename, pending, state, state_filename, progress)
+    except RangeNotSupported:
+        logger.warn('Ranges not honored for ' + resolve_file_name(url) + ', using a single stream')
+        remove_segments(state_filename)
+        os.remove(part_filename)
+        return None
+    remove_segments(state_filename)
+    return total, state['headers']
+
+
+def fetch_segments(url, part_filename, pending, state, state_filename, progress=None):
+    """
+    Fetches the `pending` segments in parallel and lists each finished one in `state_filename`.
+    When a segment fails the ones not started are cancelled and every segment that did finish is saved
+    before the error is raised, so the next attempt only asks for the missing ranges
+    """
+    total = state['size']
+    executor = ContextExecutor(max_workers=config.SEGMENT_WORKERS, thread_name_prefix='segment')
+    futures = [executor.submit(fetch_segment, url, part_filename, start,
+                               min(start + config.SEGMENT_SIZE, total) - 1, state['headers'], progress)
+               for start in pending]
+    try:
+        for future in as_completed(futures):
+            state['done'].append(future.result())
+            save_segments(state_filename, state)
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if future.done() and not future.cancelled() and future.exception() is None \
+                    and future.result() not in state['done']:
+                state['done'].append(future.result())
+        save_segments(state_filename, state)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+
+
+def fetch_segment(url, part_filename, start, end, validators, progress=None):
+    headers = {'Range': 'bytes=%d-%d' % (start, end)}
+    # a changed remote file would mix two versions, If-Range answers the whole body instead of a 206
+    if validators.get('ETag') or validators.get('Last-Modified'):
+        headers['If-Range'] = validators.get('ETag') or validators.get('Last-Modified')
+    for attempt in range(config.HTTP_RETRIES + 1):
+        with HostLimiter().slot(url) as record:
+            request_start = time.time()
+            response = HttpSession().get(url, headers=headers, stream=True, timeout=config.HTTP_TIMEOUT)
+            record(response.status_code, time.time() - request_start, response.headers.get('Retry-After'))
+            with response:
+                if response.status_code in THROTTLED:
+                    check_retry_after(url, response.headers)
+                    continue
+                if response.status_code != 206 or \
+                        not response.headers.get('Content-Range', '').startswith('bytes %d-' % start):
+                    raise RangeNotSupported()
+                position = start
+                with open(part_filename, 'r+b') as f:
+                    f.seek(start)
+                    for data in response.iter_content(config.DOWNLOAD_CHUNK_SIZE):
+                        f.write(data)
+                        position += len(data)
+                        if progress is not None:
+                            progress.update(len(data))
+                if position != end + 1:
+                    raise requests.exceptions.ChunkedEncodingError('Segment %d-%d ended at %d' % (start, end, position))
+                return start
+    raise requests.exceptions.ConnectionError('Segment %d-%d throttled too many times' % (start, end))
+
+
+def save_segments(state_filename, state):
+    tmp = state_filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, state_filename)
+
+
+def remove_segments(state_filename):
+    if os.path.exists(state_filename):
+        os.remove(state_filename)
+
+
+def remove_part(part_filename):
+    """Forget the part file of an interrupted download and the validator it was started with"""
+    for name in (part_filename, part_filename + '.if-range'):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def fetch_part(url, part_filename, validators=None, progress=None):
+    """
+    Appends the missing bytes of `url` to `part_filename`
+    Returns the size of the part file, whether it matches the Content-Length sent by the server
+    and the response, which is a 304 when `validators` still match or a 429 / 503 when throttled
+    The request waits for a slot of the adaptive per host limit
+    The ETag / Last-Modified of the response that started the part is kept in `<part>.if-range`, a resume
+    sends it as If-Range so a changed remote file answers the whole body instead of bytes of another version
+    """
+    offset, headers = resume_headers(part_filename, validators)
+
+    with HostLimiter().slot(url) as record:
+        start = time.time()
+        try:
+            response = HttpSession().get(url, headers=headers, stream=True, timeout=config.HTTP_TIMEOUT)
+        except requests.exceptions.Timeout:
+            record(None, time.time() - start)
+            raise
+        record(response.status_code, time.time() - start, response.headers.get('Retry-After'))
+        with response:
+            if response.status_code in THROTTLED:
+                # the limiter already waits Retry-After before the next request to this host
+                return offset, False, response
+            if response.status_code == 304:
+                return 0, False, response
+            if response.status_code == 416 and offset:
+                complete = range_not_satisfiable(url, part_filename, offset, response.headers)
+                return offset if complete else 0, complete, response
+            response.raise_for_status()
+
+            offset, mode = write_mode(part_filename, offset, response.status_code, response.headers)
+            content_length = response.headers.get('Content-Length')
+            expected = offset + int(content_length) if content_length is not None else None
+            if progress is not None and content_length is not None:
+                progress.expect(int(content_length))
+
+            size = offset
+            with open(part_filename, mode) as f:
+                preallocated = config.DOWNLOAD_PREALLOCATE and expected is not None and mode == 'wb'
+                if preallocated:
+                    # reserve the whole file at once, the finally below cuts it back if the body stops early
+                    f.truncate(expected)
+                try:
+                    for data in response.iter_content(config.DOWNLOAD_CHUNK_SIZE):
+                        f.write(data)
+                        size += len(data)
+                        if progress is not None:
+                            progress.update(len(data))
+                finally:
+                    if preallocated and size != expected:
+                        f.truncate(size)
+
+    return check_part(part_filename, size, expected, response)
+
+
+def resume_headers(part_filename, validators=None):
+    """Size of `part_filename` and the headers of the request resuming it, see fetch_part"""
+    offset = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+    headers = {'Range': 'bytes=%d-' % offset} if offset else dict(validators or {})
+    if offset and os.path.exists(part_filename + '.if-range'):
+        with open(part_filename + '.if-range') as f:
+            headers['If-Range'] = f.read()
+    return offset, headers
+
+
+def range_not_satisfiable(url, part_filename, offset, headers):
+    """A 416 to a resume: True when the part already holds every byte, otherwise the part is dropped"""
+    # the part file already holds every byte when Content-Range is `bytes */<offset>`
+    total = headers.get('Content-Range', '').split('/')[-1]
+    if total.isdigit() and int(total) == offset:
+        return True
+    # the remote file shrank or was replaced, every later resume would get the same 416
+    logger.warn('Remote ' + resolve_file_name(url) + ' changed, restarting it from 0')
+    remove_part(part_filename)
+    return False
+
+
+def write_mode(part_filename, offset, status, headers):
+    """Offset and open mode of the body: appended after a matching 206, otherwise written again from 0"""
+    if status == 206 and headers.get('Content-Range', '').startswith('bytes %d-' % offset):
+        return offset, 'ab'
+    # server ignored the Range header or If-Range did not match, start again from the beginning
+    validator = headers.get('ETag') or headers.get('Last-Modified')
+    if validator:
+        with open(part_filename + '.if-range', 'w') as f:
+            f.write(validator)
+    elif os.path.exists(part_filename + '.if-range'):
+        os.remove(part_filename + '.if-range')
+    return 0, 'wb'
+
+
+def check_part(part_filename, size, expected, response):
+    """The fetch_part result of a body that ended at `size` bytes, `expected` is None without Content-Length"""
+    if expected is not None and size > expected:
+        # the remote file changed since the part was written, drop it so the next attempt starts clean
+        remove_part(part_filename)
+        return 0, False, response
+    return size, expected is None or size == expected, response
 
 
 def download_file(path, info, file_name):
@@ -148,7 +491,8 @@ def download_file(path, info, file_name):
             append_write = 'w'
 
         with open(filename, append_write) as f:
-            f.write(json.dumps(info))
+            # one json per line so repeated runs can still be parsed
+            f.write(json.dumps(info) + '\n')
             #
             # for key in info.keys():
             #     f.write("%s,%s\n" % (key, info[key]))
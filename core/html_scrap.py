@@ -0,0 +1,87 @@
+import html
+import json
+import logging
+import re
+import threading
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+
+from core import config
+from core.media_urls import ImageFilter
+from core.singlenton.http_session import HttpSession
+from core.singlenton.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+CURRENT_PROJECT = re.compile(r'window\.current_project\s*=\s*"(.*?)";', re.DOTALL)
+JS_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+
+
+class HtmlScrap:
+    """
+    Same extraction methods as PageScrap but parsing the project page fetched over plain HTTP,
+    an empty list is only worth a Chrome fallback when parsed() is False
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.soup = None
+        self.project = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.soup is None:
+                self.fetch()
+        return self.soup
+
+    def parsed(self):
+        """True when the page was fetched and its `window.current_project` decoded, its answers are final"""
+        self.load()
+        return self.project is not None
+
+    def fetch(self):
+        try:
+            with Metrics().timer('page_fetch'):
+                response = HttpSession().get(self.url, timeout=config.HTTP_TIMEOUT)
+            response.raise_for_status()
+            self.soup = BeautifulSoup(response.text, 'html.parser')
+            self.project = parse_current_project(response.text)
+        except requests.exceptions.RequestException as e:
+            logger.error('Unable to fetch ' + self.url + ' -> ' + str(e))
+            self.soup = BeautifulSoup('', 'html.parser')
+
+    def get_all_images(self):
+        images = [(img.get('data-src') or img.get('src'), img.get('data-srcset') or img.get('srcset'),
+                   img.get('width'), img.get('height')) for img in self.load().find_all('img')]
+        return ImageFilter(self.url).select(images)
+
+    def get_video_links(self):
+        soup = self.load()
+        urls = [source.get('src') for source in soup.find_all('source') if source.get('src')]
+        urls += [video.get('src') for video in soup.find_all('video') if video.get('src')]
+        video = (self.project or {}).get('video') or {}
+        for key in ('high', 'base'):
+            if video.get(key):
+                urls.append(video[key])
+                break
+        return list(dict.fromkeys(urljoin(self.url, url) for url in urls))
+
+    def get_creator_links(self):
+        self.load()
+        creator = (self.project or {}).get('creator') or {}
+        return [site.get('url') for site in creator.get('websites') or [] if site.get('url')]
+
+
+def parse_current_project(text):
+    """Decode the `window.current_project` JSON embedded in the project page, or None"""
+    match = CURRENT_PROJECT.search(text)
+    if not match:
+        return None
+    try:
+        # undo only the JS string escaping (\\ -> \, \" -> "), the JSON escapes like \" inside a blurb stay valid
+        return json.loads(JS_ESCAPE.sub(r'\1', html.unescape(match.group(1))))
+    except ValueError:
+        return None
@@ -1,24 +1,160 @@
+import functools
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 
 import requests
 
+from core import config
+from core.singlenton.http_cache import HttpCache
+from core.singlenton.http_session import HttpSession
+from core.singlenton.metrics import Metrics
+
 logger = logging.getLogger(__name__)
 
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
+
+class LookupCache:
+    """
+    LRU of at most `size` results that expire after `ttl` seconds, with an optional json file per key
+    in `disk_path` so the results survive a restart
+    """
+
+    def __init__(self, endpoint, size, ttl, disk_path=None):
+        self.endpoint = endpoint
+        self.size = size
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_path:
+            os.makedirs(disk_path, exist_ok=True)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                return self.hit(entry[1])
+        entry = self.load(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            with self.lock:
+                self.remember(key, entry)
+                return self.hit(entry[1])
+        with self.lock:
+            self.misses += 1
+        Metrics().inc('api_cache_misses', endpoint=self.endpoint)
+        return None
+
+    def hit(self, value):
+        self.hits += 1
+        Metrics().inc('api_cache_hits', endpoint=self.endpoint)
+        return value
+
+    def put(self, key, value):
+        entry = (time.time(), value)
+        with self.lock:
+            self.remember(key, entry)
+        if self.disk_path:
+            # one temp file per writer, jobs storing the same creator at once must not rename each other's
+            tmp = self.file(key) + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(entry, f)
+                os.replace(tmp, self.file(key))
+            except OSError as e:
+                logger.warning('Unable to save the ' + self.endpoint + ' lookup on disk -> ' + str(e))
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def load(self, key):
+        if not self.disk_path:
+            return None
+        try:
+            with open(self.file(key)) as f:
+                return tuple(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def file(self, key):
+        return os.path.join(self.disk_path, self.endpoint + '-' + hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def memoize(endpoint, ttl):
+    """Cache the result of a one argument lookup, failed lookups (None) are not cached"""
+    disk_path = config.API_CACHE_PATH if config.API_CACHE_DISK else None
+    cache = LookupCache(endpoint, config.API_CACHE_SIZE, ttl, disk_path)
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(key):
+            value = cache.get(key)
+            if value is None:
+                value = function(key)
+                if value is not None:
+                    cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def get_json(url, endpoint='api'):
+    """
+    GET `url` and decode the JSON body, a 304 answer to the cached validators returns the cached body
+    """
+    with Metrics().timer('api_request', endpoint=endpoint):
+        return fetch_json(url)
+
+
+def fetch_json(url):
+    cache = HttpCache() if config.HTTP_CACHE_ENABLED else None
+    headers = cache.conditional_headers(url) if cache else {}
+    response = HttpSession().get(url, headers=headers, timeout=config.HTTP_TIMEOUT)
+    if response.status_code == 304:
+        body = cache.load_body(url)
+        if body is not None:
+            logger.info(msg='Not modified ' + url)
+            return body
+        # the cached body is gone, ask again without validators
+        response = HttpSession().get(url, timeout=config.HTTP_TIMEOUT)
+    body = response.json()
+    if cache and response.status_code == 200:
+        cache.store(url, response.headers, body)
+    return body
 
 
+@memoize('project', config.API_TTL_PROJECT)
 def get_project_info(project):
     try:
-        return requests.get('https://www.kickstarter.com/projects/search.json?search=&term=' + project).json()
+        return get_json('https://www.kickstarter.com/projects/search.json?search=&term=' + project, 'project')
     except requests.exceptions.RequestException as e:  # This is the correct syntax
+        Metrics().inc('api_failures', endpoint='project')
         logger.error(msg='Unable to connect..., check your connection and try again')
         pass
 
 
+@memoize('creator', config.API_TTL_CREATOR)
 def get_creator_info(url):
     try:
-        return requests.get(url).json()
+        return get_json(url, 'creator')
     except requests.exceptions.RequestException as e:  # This is the correct syntax
+        Metrics().inc('api_failures', endpoint='creator')
         logger.error(msg='Unable to connect..., check your connection and try again')
         pass
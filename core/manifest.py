@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+import time
+
+from core.singlenton.logger import Logger
+from core.singlenton.media_store import hash_file
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class Manifest:
+    """
+    Every url downloaded for a project with its file, size, sha256 and time, saved in
+    `<project>\\manifest.json` so a re-scrape only fetches media that is new or changed
+    """
+
+    projects = {}
+    projects_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path):
+        """The manifest of the project folder `path`, shared by the stages of a project until close()"""
+        with cls.projects_lock:
+            if path not in cls.projects:
+                cls.projects[path] = Manifest(path)
+            return cls.projects[path]
+
+    @classmethod
+    def close(cls, path):
+        """Forget the manifest of a finished project, the next open() reads the file again"""
+        with cls.projects_lock:
+            cls.projects.pop(path, None)
+
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.join(path, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.added = []
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                Logger().error('Manifest ' + self.filename + ' is corrupted, every file will be fetched again')
+
+    def unchanged(self, url):
+        """The saved entry when `url` was already downloaded and its file is still complete on disk"""
+        entry = self.entries.get(url)
+        if entry and os.path.exists(entry['path']) and os.path.getsize(entry['path']) == entry['size']:
+            return entry
+        return None
+
+    def record(self, result):
+        """Remember a successful `download()` result"""
+        previous = self.entries.get(result['url'])
+        if previous and previous['path'] == result['path'] and previous['size'] == result['bytes']:
+            digest = previous['sha256']
+        else:
+            digest = hash_file(result['path'])
+        with self.lock:
+            if previous is None or previous['sha256'] != digest:
+                self.added.append(result['url'])
+            self.entries[result['url']] = {'path': result['path'], 'size': result['bytes'], 'sha256': digest,
+                                           'fetched_at': int(time.time())}
+
+    def save(self):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = self.filename + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp, self.filename)
+
+    def take_added(self):
+        """Urls new or changed since the last call, used for the report at the end of a scrape"""
+        with self.lock:
+            added, self.added = self.added, []
+        return added
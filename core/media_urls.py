@@ -0,0 +1,181 @@
+import logging
+import posixpath
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode, unquote_plus
+
+from core import config
+from core.singlenton.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# imgix params only changing the rendering of an asset, variants differing by them are the same image
+VARIANT_PARAMS = ('w', 'h', 'dpr', 'q', 'fit', 'auto', 'crop', 'frame', 'gif-q', 'ixlib', 's', 'v')
+
+
+def canonicalize(url, base=None):
+    """
+    Absolute url with a lower case scheme and host, no fragment and without the MEDIA_STRIP_PARAMS params,
+    None for data:, blob: and javascript: urls. The other params are kept byte for byte, image CDNs sign them
+    """
+    if not url:
+        return None
+    url = urljoin(base, url.strip()) if base else url.strip()
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ('http', 'https') or not parts.netloc:
+        return None
+    query = [pair for pair in parts.query.split('&') if pair and not stripped(unquote_plus(pair.split('=')[0]))]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, '&'.join(query), ''))
+
+
+def stripped(param):
+    for pattern in config.MEDIA_STRIP_PARAMS:
+        if pattern.endswith('*') and param.startswith(pattern[:-1]) or param == pattern:
+            return True
+    return False
+
+
+def asset_key(url):
+    """Identity of the image behind `url`, every resolution of an asset has the same key"""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in VARIANT_PARAMS]
+    return parts.netloc, parts.path, urlencode(query)
+
+
+def variant_width(url, descriptor=None):
+    """Width of a variant from its srcset descriptor (680w), its w= param or a density descriptor (2x)"""
+    try:
+        if descriptor and descriptor.endswith('w'):
+            return int(descriptor[:-1])
+        width = dict(parse_qsl(urlsplit(url).query)).get('w')
+        if width and width.isdigit():
+            return int(width)
+        if descriptor and descriptor.endswith('x'):
+            # only ranks the variants of one srcset, 1x is taken as 1000 pixels
+            return int(float(descriptor[:-1]) * 1000)
+    except ValueError:
+        pass
+    return None
+
+
+def parse_srcset(srcset):
+    """
+    [(url, descriptor)] of a srcset attribute. Candidates are split like the HTML spec does: a url runs until
+    whitespace, so commas inside it (imgix auto=format,compress) are kept, and only a trailing comma ends it
+    """
+    candidates = []
+    text = srcset or ''
+    pos = 0
+    while pos < len(text):
+        while pos < len(text) and (text[pos].isspace() or text[pos] == ','):
+            pos += 1
+        start = pos
+        while pos < len(text) and not text[pos].isspace():
+            pos += 1
+        url = text[start:pos]
+        if not url:
+            break
+        descriptor = None
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            end = text.find(',', pos)
+            end = len(text) if end == -1 else end
+            descriptor = text[pos:end].strip() or None
+            pos = end + 1
+        candidates.append((url, descriptor))
+    return candidates
+
+
+def pick(variants, policy=None):
+    """The variant (url, width) matching SRCSET_POLICY, unknown widths only win when every width is unknown"""
+    policy = policy or config.SRCSET_POLICY
+    known = [v for v in variants if v[1] is not None]
+    if not known:
+        return variants[0]
+    if policy == 'smallest':
+        return min(known, key=lambda v: v[1])
+    if policy.isdigit():
+        fitting = [v for v in known if v[1] <= int(policy)]
+        return max(fitting, key=lambda v: v[1]) if fitting else min(known, key=lambda v: v[1])
+    return max(known, key=lambda v: v[1])
+
+
+def skipped(url):
+    """
+    True when a host label, a path segment or the file name without extension of `url` is one of the
+    MEDIA_SKIP_PATTERNS, whole names only so /pixelated-hero.jpg is not a /pixel.gif
+    """
+    parts = urlsplit(url.lower())
+    names = set(parts.netloc.split('.'))
+    for segment in parts.path.split('/'):
+        names.add(segment)
+        names.add(posixpath.splitext(segment)[0])
+    return any(pattern in names for pattern in config.MEDIA_SKIP_PATTERNS if pattern)
+
+
+class ImageFilter:
+    """
+    Turns the <img> of one page into the image urls worth downloading: canonical urls, one resolution per asset
+    chosen by SRCSET_POLICY, without data: uris, tracking pixels, avatars and other MEDIA_SKIP_PATTERNS
+    accept() decides image by image for a page being scrolled, select() sees every image of the page at once
+    """
+
+    def __init__(self, base_url=None, policy=None):
+        self.base_url = base_url
+        self.policy = policy
+        self.seen = set()
+        self.skipped = 0
+
+    def variants(self, src, srcset=None, width=None, height=None):
+        if self.too_small(width) or self.too_small(height):
+            return self.skip('tiny')
+        variants = []
+        for url, descriptor in parse_srcset(srcset) + [(src, None)]:
+            url = canonicalize(url, self.base_url)
+            if url is not None:
+                variants.append((url, variant_width(url, descriptor)))
+        if not variants:
+            return self.skip('inline')
+        if any(skipped(url) for url, _ in variants):
+            return self.skip('pattern')
+        return variants
+
+    def too_small(self, size):
+        try:
+            return size is not None and str(size) != '' and int(size) <= config.MEDIA_MIN_SIZE
+        except ValueError:
+            return False
+
+    def skip(self, reason):
+        self.skipped += 1
+        Metrics().inc('images_skipped', reason=reason)
+        return []
+
+    def accept(self, src, srcset=None, width=None, height=None):
+        """Url to download for this image or None when it is skipped or its asset was already accepted"""
+        variants = self.variants(src, srcset, width, height)
+        if not variants:
+            return None
+        url = pick(variants, self.policy)[0]
+        key = asset_key(url)
+        if key in self.seen:
+            Metrics().inc('images_skipped', reason='duplicate')
+            self.skipped += 1
+            return None
+        self.seen.add(key)
+        return url
+
+    def select(self, images):
+        """Urls to download for `images`, an iterable of (src, srcset, width, height), in page order"""
+        assets = {}
+        count = 0
+        for image in images:
+            count += 1
+            for variant in self.variants(*image):
+                assets.setdefault(asset_key(variant[0]), []).append(variant)
+        urls = []
+        for key, variants in assets.items():
+            if key not in self.seen:
+                self.seen.add(key)
+                urls.append(pick(variants, self.policy)[0])
+        logger.info('%d of %d images kept after removing duplicates and non content images' % (len(urls), count))
+        return urls
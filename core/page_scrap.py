@@ -8,19 +8,60 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+from core import config
+from core.media_urls import ImageFilter
+from core.singlenton.metrics import Metrics
 from core.singlenton.webdriver import WebDriver
 
 logger = logging.getLogger(__name__)
 
+# Number of <img> (or only arguments[0] when given) still waiting for a lazy loader to resolve their src
+PENDING_IMAGES_SCRIPT = """
+var images = arguments[0] ? [arguments[0]] : Array.prototype.slice.call(document.images);
+return images.filter(function (img) {
+    var src = img.currentSrc || img.src;
+    var lazy = img.getAttribute('data-src') || img.getAttribute('data-srcset');
+    return !src || !img.complete || (lazy && src.indexOf('data:') === 0);
+}).length;
+"""
+# src, srcset and natural size of arguments[0] in one round trip, the size is null until the image loaded
+IMAGE_ATTRIBUTES_SCRIPT = """
+var img = arguments[0];
+return [img.src, img.getAttribute('srcset'), img.naturalWidth || null, img.naturalHeight || null];
+"""
+RESOURCE_COUNT_SCRIPT = "return window.performance.getEntriesByType('resource').length;"
+
+
+class images_resolved(object):
+    """
+    Expected condition true when every image resolved its src and no new network resource
+    started since the previous poll
+    """
+
+    def __init__(self, element=None):
+        self.element = element
+        self.resources = -1
+
+    def __call__(self, driver):
+        pending = driver.execute_script(PENDING_IMAGES_SCRIPT, self.element)
+        if self.element is not None:
+            return pending == 0
+        resources = driver.execute_script(RESOURCE_COUNT_SCRIPT)
+        idle = resources == self.resources
+        self.resources = resources
+        return pending == 0 and idle
+
 
 class PageScrap:
 
-    def __init__(self):
+    def __init__(self, driver=None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) '
                           'Chrome/50.0.2661.102 Safari/537.36'}
 
-        self.driver = WebDriver()
+        # a driver leased from the WebDriverPool, the GUI browser singleton otherwise
+        self.driver = driver if driver is not None else WebDriver()
+        self.timings = {}
 
     def get_video_links(self):
         try:
@@ -45,18 +86,7 @@ class PageScrap:
 
     def get_all_images(self):
         try:
-            WebDriverWait(self.driver, 20).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "rte__content")))
-            images = self.driver.find_elements_by_tag_name('img')
-
-            for i in images:
-                self.driver.execute_script("arguments[0].scrollIntoView();", i)
-                time.sleep(2)
-
-            time.sleep(10)
-            img_tags = self.driver.find_elements_by_tag_name('img')
-            urls = [img.get_attribute('src') for img in img_tags]
-            return urls
+            return list(self.iter_images())
         except TimeoutException as e:
             logger.error('TimeoutException ' + e.msg)
             return ValueError
@@ -64,6 +94,55 @@ class PageScrap:
             logger.error('WebDriverException ' + e.msg)
             return ValueError
 
+    def iter_images(self):
+        """
+        Yields the src of every image as soon as it resolved while the page is scrolled,
+        so the downloads start before the end of the page
+        """
+        WebDriverWait(self.driver, 20).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "rte__content")))
+        images = self.driver.find_elements_by_tag_name('img')
+        image_filter = ImageFilter(self.driver.current_url)
+
+        start = time.time()
+        for i in images:
+            self.driver.execute_script("arguments[0].scrollIntoView();", i)
+            if self.wait_for(images_resolved(i), config.IMAGE_LOAD_TIMEOUT):
+                src = image_filter.accept(*self.image_attributes(i))
+                if src:
+                    yield src
+        self.timings['scroll'] = time.time() - start
+
+        start = time.time()
+        if not self.wait_for(images_resolved(), config.PAGE_IMAGES_TIMEOUT):
+            pending = self.driver.execute_script(PENDING_IMAGES_SCRIPT, None)
+            logger.warning(str(pending) + ' images still loading after ' + str(config.PAGE_IMAGES_TIMEOUT) + 's')
+        self.timings['images_wait'] = time.time() - start
+        Metrics().observe('page_scroll', self.timings['scroll'])
+        Metrics().observe('page_images_wait', self.timings['images_wait'])
+        logger.info('Scrolled %d images in %.1fs, waited %.1fs for lazy images' %
+                    (len(images), self.timings['scroll'], self.timings['images_wait']))
+
+        # images added or resolved after the scroll
+        img_tags = self.driver.find_elements_by_tag_name('img')
+        for attributes in [self.image_attributes(img) for img in img_tags]:
+            src = image_filter.accept(*attributes)
+            if src:
+                yield src
+        logger.info('%d images skipped as duplicates or non content images' % image_filter.skipped)
+
+    def image_attributes(self, img):
+        """src, srcset, width and height of an <img>, the arguments of ImageFilter.accept"""
+        return self.driver.execute_script(IMAGE_ATTRIBUTES_SCRIPT, img)
+
+    def wait_for(self, condition, timeout):
+        """Wait until `condition` is true, returns False when `timeout` seconds passed first"""
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=0.25).until(condition)
+            return True
+        except TimeoutException:
+            return False
+
     def get_creator_links(self):
         try:
             elem = self.driver.find_element_by_class_name("keyboard-focusable-soft-black")
@@ -0,0 +1,52 @@
+import threading
+import time
+
+from tqdm import tqdm
+
+from core.singlenton.logger import Logger
+
+
+class ProgressReporter:
+    """
+    One progress bar and rate for a whole batch of downloads, shared by every download thread
+    """
+
+    def __init__(self, description, files=0):
+        self.description = description
+        self.lock = threading.Lock()
+        self.files = files
+        self.done = 0
+        self.bytes = 0
+        self.start = time.time()
+        self.bar = tqdm(desc=description, total=0, unit="B", unit_scale=True, unit_divisor=1024,
+                        mininterval=0.5, postfix=self.postfix())
+
+    def postfix(self):
+        return 'files=%d/%d' % (self.done, self.files)
+
+    def add_file(self):
+        with self.lock:
+            self.files += 1
+            self.bar.set_postfix_str(self.postfix(), refresh=False)
+
+    def expect(self, size):
+        """Add the Content-Length of a file that started downloading to the total"""
+        with self.lock:
+            self.bar.total += size
+
+    def update(self, size):
+        with self.lock:
+            self.bytes += size
+            self.bar.update(size)
+
+    def file_done(self, *args):
+        with self.lock:
+            self.done += 1
+            self.bar.set_postfix_str(self.postfix(), refresh=False)
+
+    def close(self):
+        elapsed = max(time.time() - self.start, 0.001)
+        self.bar.close()
+        Logger().info('%s: %d files, %.1f MB in %.1fs (%.2f MB/s)' % (self.description, self.done,
+                                                                      self.bytes / 1048576, elapsed,
+                                                                      self.bytes / 1048576 / elapsed))
@@ -0,0 +1,326 @@
+import logging
+import re
+import threading
+import time
+
+from core import config
+from core.downloader import get_all_media, get_all_media_stream, get_all_thumbnails, download_file, count_status
+from core.kickstarter_service import get_project_info, get_creator_info
+from core.html_scrap import HtmlScrap
+from core.manifest import Manifest
+from core.singlenton.app_path import AppPath
+from core.singlenton.download_executor import ContextExecutor
+from core.singlenton.metadata_store import MetadataStore
+from core.singlenton.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+def process_url(url: str):
+    routes = ['/description', '/faqs', '/posts', '/comments', '/community']
+    for route in routes:
+        url = url.replace(route, '')
+    return url
+
+
+def is_valid_url(url):
+    # Regex to check valid URL
+    regex = ("((http|https)://)(www.)?" +
+             "[a-zA-Z0-9@:%._\\+~#?&//=]" +
+             "{2,256}\\.[a-z]" +
+             "{2,6}\\b([-a-zA-Z0-9@:%" +
+             "._\\+~#?&//=]*)")
+
+    # Compile the ReGex
+    p = re.compile(regex)
+
+    # If the string is empty
+    # return false
+    if url is None:
+        return False
+
+    # Return if the string
+    # matched the ReGex
+    if re.search(p, url):
+        return True
+    else:
+        return False
+
+
+def build_object_project(project):
+    return {
+        "name": project['name'],
+        "blurb": project['blurb'],
+        "goal": project['goal'],
+        "pledged": project['pledged'],
+        "state": project['state'],
+        "slug": project['slug'],
+        "disable_communication": project['disable_communication'],
+        "country": project['country'],
+        "country_displayable_name": project['country_displayable_name'],
+        "currency": project['currency'],
+        "currency_symbol": project['currency_symbol'],
+        "currency_trailing_code": project['currency_trailing_code'],
+        "deadline": project['deadline'],
+        "state_changed_at": project['state_changed_at'],
+        "created_at": project['created_at'],
+        "launched_at": project['launched_at'],
+        "staff_pick": project['staff_pick'],
+        "is_starrable": project['is_starrable'],
+        "backers_count": project['backers_count'],
+        "static_usd_rate": project['static_usd_rate'],
+        "usd_pledged": project['usd_pledged'],
+        "converted_pledged_amount": project['converted_pledged_amount'],
+        "fx_rate": project['fx_rate'],
+        "current_currency": project['current_currency'],
+        "usd_type": project['usd_type'],
+    }
+
+
+def get_project_id(url):
+    project_id = process_url(url).split('?')[0].split('/')[-1]
+    logger.info(project_id.upper())
+    return project_id
+
+
+class ProjectPage:
+    """
+    Extracts media from the project page with the HTTP fast path and falls back to the Selenium
+    PageScrap only when the page or its project JSON could not be fetched or parsed, an empty answer
+    of a parsed page (no video, no creator websites) is final and Chrome is not touched
+    Without `scraper` a driver is leased from the WebDriverPool and returned by close()
+    The driver is used by one stage at a time, the others wait on `driver_lock`
+    Once `cancelled` is set every stage finds nothing more and the running downloads drain
+    """
+
+    def __init__(self, url, scraper=None, cancelled=None):
+        self.url = url
+        self.html = HtmlScrap(url) if config.HTML_FAST_PATH else None
+        self._scraper = scraper
+        self.pool = None
+        self.leased_driver = None
+        self.driver_lock = threading.RLock()
+        self.cancelled = cancelled or threading.Event()
+
+    @property
+    def scraper(self):
+        if self._scraper is None:
+            from core.page_scrap import PageScrap
+            from core.singlenton.webdriver_pool import WebDriverPool
+            # released to this pool even if WebDriverPool.shutdown() replaced the singleton meanwhile
+            self.pool = WebDriverPool()
+            self.leased_driver = self.pool.acquire()
+            with Metrics().timer('page_load'):
+                self.leased_driver.get(self.url)
+            self._scraper = PageScrap(self.leased_driver)
+        return self._scraper
+
+    def close(self):
+        if self.leased_driver is not None:
+            self.pool.release(self.leased_driver)
+            self.leased_driver = None
+            self._scraper = None
+
+    def first(self, method):
+        if self.cancelled.is_set():
+            return []
+        if self.html is not None:
+            urls = getattr(self.html, method)()
+            if urls or self.html.parsed():
+                return urls
+            logger.info('Project page not parsed over HTTP for ' + method + ', using Chrome')
+        with self.driver_lock:
+            return getattr(self.scraper, method)()
+
+    def get_all_images(self):
+        return self.first('get_all_images')
+
+    def iter_images(self):
+        """Yields image urls while Chrome scrolls the page, or every url of the HTTP fast path at once"""
+        for url in self.find_images():
+            if self.cancelled.is_set():
+                return
+            yield url
+
+    def find_images(self):
+        if self.html is not None:
+            urls = self.html.get_all_images()
+            if urls or self.html.parsed():
+                yield from urls
+                return
+            logger.info('Project page not parsed over HTTP for get_all_images, using Chrome')
+        from selenium.common.exceptions import WebDriverException
+        with self.driver_lock:
+            try:
+                yield from self.scraper.iter_images()
+            except WebDriverException as e:
+                logger.error('WebDriverException ' + str(e))
+
+    def get_video_links(self):
+        return self.first('get_video_links')
+
+    def get_creator_links(self):
+        return self.first('get_creator_links')
+
+    def scroll_top(self):
+        if self._scraper is not None:
+            with self.driver_lock:
+                self._scraper.driver.execute_script("window.scrollTo(0,0)")
+
+
+def default_scraper():
+    from core.page_scrap import PageScrap
+    return PageScrap()
+
+
+def download_creator_info(project, path, page=None):
+    logger.info("Downloading creator info")
+    try:
+        creator_api_url = project["creator"]["urls"]["api"]['user']
+        creator = get_creator_info(creator_api_url)
+        logger.info("Creator is " + creator["name"] + ", generating info...")
+        creator_info = {
+            "name": creator["name"],
+            "profile": creator["urls"]["web"]["user"],
+            "biography": creator["biography"],
+            "links": (page or default_scraper()).get_creator_links()
+        }
+        logger.info("Downloading " + creator["name"] + " thumbnails...")
+        get_all_thumbnails(creator['avatar'], path + 'creator\\avatar', Manifest.open(path))
+        logger.info("Thumbnails downloaded...")
+        download_file(path + "creator\\", creator_info, "creator-info.txt")
+        MetadataStore().upsert_creator(creator_info)
+    except Exception as e:
+        logger.error("Error getting creator info ->" + str(e))
+
+
+def download_project_info(project_id, path, page=None):
+    logger.info(msg='Searching project ' + project_id + 'info in Kickstarter')
+    project_json = get_project_info(project_id)
+    if project_json is not None and len(project_json['projects']) > 0:
+        project = project_json['projects'][0]
+        logging.info(msg='Download project info')
+        info = build_object_project(project)
+        download_file(path, info, "project-info.txt")
+        MetadataStore().upsert_projects([(info, project.get('id'), project.get('creator', {}).get('name'))])
+        logging.info(msg='Project info downloaded')
+        logger.info('Searching project thumbnails...')
+        get_all_thumbnails(project['photo'], path + 'video\\thumbnails', Manifest.open(path))
+        logger.info('Thumbnails downloaded')
+        download_creator_info(project, path, page)
+        return True
+    else:
+        logger.error('Kickstarter project not found')
+        return False
+
+
+def report_added(path):
+    """Log and return the urls new or changed in the project since its previous scrape"""
+    added = Manifest.open(path).take_added()
+    logger.info(str(len(added)) + ' new or changed files')
+    for url in added:
+        logger.debug('Added ' + url)
+    return added
+
+
+def write_project_metrics(path, project_metrics):
+    """Save the `project_metrics` scope in `<path>metrics.json` and refresh the process wide Prometheus file"""
+    project_metrics.write_json(path + 'metrics.json', project_metrics.snapshot())
+    Metrics().write_prometheus(config.METRICS_PROM_PATH)
+
+
+def get_project_path(project_id):
+    path = AppPath() + '\\downloads\\' + project_id + '\\'
+    logger.info('Project will save in ' + path)
+    return path
+
+
+def download_images(path, page):
+    logger.info(msg='Init project images download')
+    images_content = page.get_all_images()
+    result = {}
+    try:
+        if images_content is not None:
+            logger.info(msg='Found ' + str(len(images_content)) + ' images, starting download')
+            result = get_all_media(images_content, path, '', 'images', Manifest.open(path))
+            logger.info(msg='Project images downloaded successfully ' + str(count_status(result)))
+    except TypeError as e:
+        logger.error('ERROR getting images from page -> ' + str(e))
+    page.scroll_top()
+    return result
+
+
+def download_images_stream(path, page):
+    """Same as download_images but every url is downloaded as soon as the scroll discovers it"""
+    logger.info(msg='Init project images download')
+    result = get_all_media_stream(page.iter_images(), path, '', 'images', Manifest.open(path))
+    logger.info(msg='Project images downloaded successfully ' + str(count_status(result)))
+    page.scroll_top()
+    return result
+
+
+def download_project(project_id, path, page):
+    """
+    Runs the stages of a project at the same time: images are downloaded while the page is scrolled,
+    videos and project info (API, thumbnails, creator) run on their own threads.
+    Returns the images and videos results and whether the project info was found
+    """
+    with ContextExecutor(max_workers=2, thread_name_prefix='stage') as stages:
+        videos = stages.submit(download_videos, path, page)
+        info = stages.submit(download_project_info, project_id, path, page)
+        images = download_images_stream(path, page)
+        return images, videos.result(), info.result()
+
+
+def scrape_project(url, cancelled=None):
+    """
+    Scrape images, videos and project info of one project url, returns a summary dict
+    Setting the `cancelled` event stops the project after the downloads already started
+    """
+    start = time.time()
+    summary = {'url': url, 'project_id': None, 'status': 'error', 'images': 0, 'videos': 0, 'added': 0,
+               'failed': 0, 'bytes': 0, 'seconds': 0}
+    try:
+        if not (is_valid_url(url) and url.startswith("https://www.kickstarter.com/projects/")):
+            summary['status'] = 'invalid url'
+            return summary
+        project_id = get_project_id(url)
+        summary['project_id'] = project_id
+        path = get_project_path(project_id)
+        # Chrome is only started by ProjectPage when the HTTP fast path finds nothing
+        with Metrics.scope() as project_metrics:
+            page = ProjectPage(url, cancelled=cancelled)
+            try:
+                images, videos, found = download_project(project_id, path, page)
+                summary['images'] = len(images)
+                summary['videos'] = len(videos)
+                results = list(images.values()) + list(videos.values())
+                summary['failed'] = len([r for r in results if r['status'] == 'error'])
+                summary['bytes'] = sum(r['bytes'] for r in results)
+                summary['status'] = 'ok' if found else 'not found'
+                if page.cancelled.is_set():
+                    summary['status'] = 'cancelled'
+                summary['added'] = len(report_added(path))
+            finally:
+                page.close()
+                Manifest.close(path)
+                write_project_metrics(path, project_metrics)
+    except Exception as e:
+        logger.error('Error scraping ' + url + ' -> ' + str(e))
+    summary['seconds'] = round(time.time() - start, 1)
+    return summary
+
+
+def download_videos(path, page):
+    logger.info(msg='Init project video download')
+    videos = page.get_video_links()
+    result = {}
+    try:
+        if videos is not None:
+            logger.info(msg='Found ' + str(len(videos)) + ' videos, starting download')
+            result = get_all_media(videos, path + 'video', manifest=Manifest.open(path))
+            logger.info(msg='Project videos downloaded successfully ' + str(count_status(result)))
+    except TypeError as e:
+        logger.error('ERROR getting videos from page -> ' + str(e))
+    page.scroll_top()
+    return result
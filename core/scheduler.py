@@ -0,0 +1,137 @@
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core import config
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+CANCELLING = 'cancelling'
+CANCELLED = 'cancelled'
+DONE = 'done'
+FAILED = 'failed'
+
+FINISHED = (CANCELLED, DONE, FAILED)
+
+
+def read_urls(source):
+    urls = []
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    # keep the order but scrape every project only once
+    return list(dict.fromkeys(urls))
+
+
+class Job:
+    """One project url waiting in or run by the JobScheduler, `summary` is set when it finished"""
+
+    ids = itertools.count(1)
+
+    def __init__(self, url):
+        self.id = next(Job.ids)
+        self.url = url
+        self.status = QUEUED
+        self.summary = None
+        self.cancelled = threading.Event()
+        self.future = None
+
+
+class JobScheduler:
+    """
+    Runs scrape jobs on at most `workers` threads in submission order, a url already queued or running
+    is not submitted twice. Queued jobs are dropped on cancel, running ones stop after their started downloads
+    """
+
+    def __init__(self, workers=None, run=None):
+        self.workers = workers or config.SCHEDULER_WORKERS
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        self.jobs = []
+        self.lock = threading.Lock()
+        self._run = run
+
+    def submit(self, url):
+        with self.lock:
+            for job in self.jobs:
+                if job.url == url and job.status not in FINISHED:
+                    logger.info('Project already queued ' + url)
+                    return job
+            job = Job(url)
+            self.jobs.append(job)
+            # under the lock so cancel() never sees a queued job without its future
+            job.future = self.executor.submit(self.execute, job)
+        logger.info('Queued job %d %s, %d waiting' % (job.id, url, self.depth()))
+        return job
+
+    def submit_file(self, filename):
+        with open(filename) as f:
+            return [self.submit(url) for url in read_urls(f)]
+
+    def execute(self, job):
+        with self.lock:
+            if job.cancelled.is_set():
+                return
+            job.status = RUNNING
+        logger.info('Starting job %d %s' % (job.id, job.url))
+        try:
+            job.summary = self.run(job.url, job.cancelled)
+            status = job.summary['status']
+            if job.cancelled.is_set():
+                job.status = CANCELLED
+            else:
+                job.status = DONE if status == 'ok' else FAILED
+            logger.info('Job %d %s' % (job.id, status))
+        except Exception as e:
+            job.status = FAILED
+            logger.error('Job %d failed -> %s' % (job.id, str(e)))
+
+    def run(self, url, cancelled):
+        if self._run is None:
+            from core.project import scrape_project
+            self._run = scrape_project
+        return self._run(url, cancelled)
+
+    def cancel(self, job_id):
+        """Cancel the job `job_id`, returns False when it already finished"""
+        with self.lock:
+            job = next((j for j in self.jobs if j.id == job_id), None)
+            if job is None or job.status in FINISHED:
+                return False
+            job.cancelled.set()
+            if job.status == QUEUED:
+                job.future.cancel()
+                job.status = CANCELLED
+            else:
+                job.status = CANCELLING
+        logger.info('Cancelled job %d %s' % (job.id, job.url))
+        return True
+
+    def cancel_all(self):
+        for job in self.snapshot():
+            self.cancel(job.id)
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job.status not in FINISHED]
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def depth(self):
+        """Number of jobs waiting for a worker"""
+        with self.lock:
+            return len([job for job in self.jobs if job.status == QUEUED])
+
+    def running(self):
+        with self.lock:
+            return len([job for job in self.jobs if job.status in (RUNNING, CANCELLING)])
+
+    def shutdown(self, wait=False):
+        """Cancel every job, queued ones never start so the process exits once the running ones drained"""
+        self.cancel_all()
+        self.executor.shutdown(wait=wait, cancel_futures=True)
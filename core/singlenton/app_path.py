@@ -1,5 +1,4 @@
 import os
-from selenium import webdriver
 
 
 class AppPath:
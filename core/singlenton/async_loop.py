@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import aiohttp
+
+from core import config
+
+
+class AsyncLoop:
+    class __AsyncLoop:
+        """
+        One event loop on a daemon thread and one aiohttp session for the whole process, every download of the
+        asyncio engine runs here so ASYNC_MAX_IN_FLIGHT and ASYNC_MAX_PER_HOST hold across stages and jobs
+        """
+
+        def __init__(self):
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, name='async-downloader', daemon=True)
+            self.thread.start()
+            self.session = self.submit(create_session()).result()
+
+        def submit(self, coroutine):
+            """Schedule `coroutine` on the loop from any thread, returns a concurrent.futures.Future"""
+            # the task runs in a copy of the caller's context, e.g. its Metrics.scope()
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+        def close(self):
+            self.submit(self.stop()).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+
+        async def stop(self):
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.session.close()
+
+    instance = None
+    lock = threading.Lock()
+
+    def __new__(cls):
+        if not AsyncLoop.instance:
+            with AsyncLoop.lock:
+                if not AsyncLoop.instance:
+                    AsyncLoop.instance = AsyncLoop.__AsyncLoop()
+        return AsyncLoop.instance
+
+    @staticmethod
+    def shutdown():
+        """Cancel the running downloads and stop the loop, the next AsyncLoop() starts a new one"""
+        with AsyncLoop.lock:
+            if AsyncLoop.instance:
+                AsyncLoop.instance.close()
+                AsyncLoop.instance = None
+
+
+async def create_session():
+    connector = aiohttp.TCPConnector(limit=config.ASYNC_MAX_IN_FLIGHT, limit_per_host=config.ASYNC_MAX_PER_HOST)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=config.HTTP_TIMEOUT, sock_read=config.HTTP_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers={'User-Agent': config.USER_AGENT})
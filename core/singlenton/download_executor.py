@@ -0,0 +1,35 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from core import config
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor running every task in a copy of the submitter's context, e.g. its Metrics.scope()"""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class DownloadExecutor:
+    class __DownloadExecutor:
+        def __init__(self):
+            self.executor = ContextExecutor(max_workers=config.DOWNLOAD_WORKERS,
+                                               thread_name_prefix='downloader')
+
+    executor = None
+
+    def __new__(cls):
+        if not DownloadExecutor.executor:
+            DownloadExecutor.executor = DownloadExecutor.__DownloadExecutor().executor
+        return DownloadExecutor.executor
+
+    @staticmethod
+    def shutdown(wait=True, cancel_futures=False):
+        """
+        Stop the shared workers, the next DownloadExecutor() call starts a new pool
+        With `cancel_futures` the queued downloads are dropped instead of run before the process exits
+        """
+        if DownloadExecutor.executor:
+            DownloadExecutor.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+            DownloadExecutor.executor = None
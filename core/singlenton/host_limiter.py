@@ -0,0 +1,112 @@
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from core import config
+from core.singlenton.logger import Logger
+from core.singlenton.metrics import Metrics
+
+THROTTLED = (429, 503)
+
+
+class HostState:
+    def __init__(self):
+        self.limit = float(config.HOST_START_CONCURRENCY)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency = None
+        self.last_decrease = 0.0
+
+
+class HostLimiter:
+    class __HostLimiter:
+        """
+        Concurrency limit per host adapted with AIMD: +1 / limit for every healthy response,
+        halved on 429 / 503 or when the latency jumps, and no request at all before Retry-After
+        """
+
+        def __init__(self):
+            self.condition = threading.Condition()
+            self.hosts = {}
+
+        @contextmanager
+        def slot(self, url):
+            """Wait for a free slot of the url host, the body is `record(status, latency, retry_after)`"""
+            host = urlparse(url).netloc
+            self.acquire(host)
+            results = []
+            try:
+                yield lambda status, latency, retry_after=None: results.append((status, latency, retry_after))
+            finally:
+                self.release(host, *(results[0] if results else (None, None, None)))
+
+        def acquire(self, host):
+            with self.condition:
+                state = self.hosts.setdefault(host, HostState())
+                while True:
+                    wait = state.blocked_until - time.time()
+                    if wait <= 0 and state.in_flight < int(state.limit):
+                        state.in_flight += 1
+                        return
+                    self.condition.wait(timeout=wait if wait > 0 else None)
+
+        def release(self, host, status, latency, retry_after):
+            with self.condition:
+                state = self.hosts[host]
+                state.in_flight -= 1
+                now = time.time()
+                if status in THROTTLED:
+                    self.decrease(host, state, now)
+                    wait = min(retry_seconds(retry_after), config.HOST_MAX_RETRY_AFTER)
+                    state.blocked_until = max(state.blocked_until, now + wait)
+                    Metrics().inc('download_throttled', host=host, status=status)
+                elif status is None and latency is not None:
+                    # timed out
+                    self.decrease(host, state, now)
+                elif latency is not None and status < 400:
+                    if state.latency is not None and latency > state.latency * config.HOST_LATENCY_FACTOR:
+                        self.decrease(host, state, now)
+                    else:
+                        state.limit = min(config.HOST_MAX_CONCURRENCY, state.limit + 1.0 / state.limit)
+                    # exponential moving average of the time to the response headers
+                    state.latency = latency if state.latency is None else state.latency * 0.8 + latency * 0.2
+                self.condition.notify_all()
+
+        def decrease(self, host, state, now):
+            # one decrease per average round trip (1s before the first answer), otherwise a burst of slow or
+            # throttled answers collapses the limit
+            if now - state.last_decrease < (state.latency or 1.0):
+                return
+            state.limit = max(config.HOST_MIN_CONCURRENCY, state.limit / 2)
+            state.last_decrease = now
+            Logger().info('Concurrency for ' + host + ' lowered to ' + str(int(state.limit)))
+
+        def limit(self, url):
+            state = self.hosts.get(urlparse(url).netloc)
+            return int(state.limit) if state else config.HOST_START_CONCURRENCY
+
+    instance = None
+
+    def __new__(cls):
+        if not HostLimiter.instance:
+            HostLimiter.instance = HostLimiter.__HostLimiter()
+        return HostLimiter.instance
+
+    @staticmethod
+    def reset():
+        """Forget the limits learned so far, the next HostLimiter() starts every host again"""
+        HostLimiter.instance = None
+
+
+def retry_seconds(retry_after):
+    """Seconds from a Retry-After header (delay or http date), 1s when the server didn't send one"""
+    if retry_after:
+        if retry_after.strip().isdigit():
+            return int(retry_after)
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return 1.0
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from core import config
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body INTEGER NOT NULL
+);
+"""
+
+
+class HttpCache:
+    class __HttpCache:
+        """
+        Keeps the ETag / Last-Modified validators of every url in the `<cache>/index.db` sqlite table,
+        API bodies are saved next to it in `<cache>/bodies/<sha1(url)>.json`
+        Storing a url writes one row, the cost doesn't grow with the number of urls already cached
+        """
+
+        def __init__(self, path):
+            self.path = path
+            self.bodies_path = os.path.join(path, 'bodies')
+            self.lock = threading.Lock()
+            os.makedirs(self.bodies_path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(path, 'index.db'), timeout=30, check_same_thread=False)
+            # batch workers share the cache, a lost last write only costs a full download
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+
+        def entry(self, url):
+            with self.lock:
+                row = self.connection.execute('SELECT etag, last_modified, body FROM validators WHERE url = ?',
+                                              (url,)).fetchone()
+            return {'etag': row[0], 'last_modified': row[1], 'body': bool(row[2])} if row else {}
+
+        def conditional_headers(self, url):
+            """Return the If-None-Match / If-Modified-Since headers known for `url`"""
+            entry = self.entry(url)
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+        def store(self, url, response_headers, body=None):
+            """Remember the validators of a 200 response, `body` is saved for JSON calls"""
+            etag = response_headers.get('ETag')
+            last_modified = response_headers.get('Last-Modified')
+            if not etag and not last_modified:
+                return
+            if body is not None:
+                tmp = self.body_path(url) + '.%d.tmp' % threading.get_ident()
+                with open(tmp, 'w') as f:
+                    json.dump(body, f)
+                os.replace(tmp, self.body_path(url))
+            with self.lock, self.connection:
+                self.connection.execute('INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?)',
+                                        (url, etag, last_modified, int(body is not None)))
+
+        def load_body(self, url):
+            if not self.entry(url).get('body'):
+                return None
+            try:
+                with open(self.body_path(url)) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return None
+
+        def body_path(self, url):
+            return os.path.join(self.bodies_path, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    instance = None
+    # the stages of the first project ask for it at the same time, only one may open the database
+    lock = threading.Lock()
+
+    def __new__(cls):
+        if not HttpCache.instance:
+            with HttpCache.lock:
+                if not HttpCache.instance:
+                    HttpCache.instance = HttpCache.__HttpCache(config.HTTP_CACHE_PATH)
+        return HttpCache.instance
+
+    @staticmethod
+    def close():
+        """Close the database, the next HttpCache() opens HTTP_CACHE_PATH again"""
+        with HttpCache.lock:
+            if HttpCache.instance:
+                HttpCache.instance.connection.close()
+                HttpCache.instance = None
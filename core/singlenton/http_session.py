@@ -0,0 +1,34 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+from core import config
+
+
+class HttpSession:
+    class __HttpSession:
+        def __init__(self):
+            self.session = requests.Session()
+            # 429 / 503 and their Retry-After are left to HostLimiter, urllib3 would sleep for any Retry-After
+            retry = Retry(total=config.HTTP_RETRIES, connect=config.HTTP_RETRIES, read=config.HTTP_RETRIES,
+                          backoff_factor=config.HTTP_BACKOFF_FACTOR, status_forcelist=(500, 502, 504),
+                          respect_retry_after_header=False)
+            # One adapter for every host, each host gets its own pool of keep-alive connections
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_HOSTS, pool_maxsize=config.HTTP_POOL_SIZE,
+                                  max_retries=retry)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            self.session.headers.update({'User-Agent': config.USER_AGENT, 'Connection': 'keep-alive'})
+
+    session = None
+
+    def __new__(cls):
+        if not HttpSession.session:
+            HttpSession.session = HttpSession.__HttpSession().session
+        return HttpSession.session
+
+    @staticmethod
+    def close():
+        if HttpSession.session:
+            HttpSession.session.close()
+            HttpSession.session = None
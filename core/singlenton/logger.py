@@ -1,15 +1,117 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+from core import config
+
 try:
     from cStringIO import StringIO      # Python 2
 except ImportError:
     from io import StringIO
 
 
+class JsonFormatter(logging.Formatter):
+    """One json object per record"""
+
+    def format(self, record):
+        data = {'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), 'level': record.levelname,
+                'logger': record.name, 'thread': record.threadName, 'message': record.getMessage()}
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data)
+
+
+class BatchFileHandler(RotatingFileHandler):
+    """Rotating file handler that only flushes when the listener finished writing a batch"""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class FastQueueHandler(QueueHandler):
+    """Only merges the message arguments in the logging thread, the formatting happens in the listener"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BatchListener(threading.Thread):
+    """Writes the queued records by batches of up to `batch_size` to every handler, then flushes once"""
+
+    def __init__(self, log_queue, handlers, batch_size=500):
+        super().__init__(name='log-writer', daemon=True)
+        self.log_queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+
+    def run(self):
+        while True:
+            record = self.log_queue.get()
+            stop = record is None
+            batch = [] if stop else [record]
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.log_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            for handler in self.handlers:
+                for record in batch:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                getattr(handler, 'flush_batch', handler.flush)()
+            if stop:
+                return
+
+    def stop(self):
+        self.log_queue.put(None)
+        self.join(timeout=5)
+
+
 class Logger:
     class __Logger:
         def __init__(self):
-            logging.basicConfig(filename='downloader.log', level=logging.DEBUG, format='%(asctime)s %(message)s',
-                                datefmt='%d/%m/%Y %H:%M:%S')
+            handler = BatchFileHandler(config.LOG_FILE, maxBytes=config.LOG_MAX_BYTES,
+                                       backupCount=config.LOG_BACKUP_COUNT, delay=True)
+            if config.LOG_JSON:
+                handler.setFormatter(JsonFormatter())
+            else:
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%d/%m/%Y %H:%M:%S'))
+            root = logging.getLogger()
+            # the console handler of logging.basicConfig() also moves to the listener thread, so no logging
+            # thread waits on a stream lock, and keeps the level basicConfig gave to the root logger
+            console = list(root.handlers)
+            for previous in console:
+                root.removeHandler(previous)
+                if previous.level == logging.NOTSET:
+                    previous.setLevel(root.level)
+            log_queue = queue.SimpleQueue()
+            self.listener = BatchListener(log_queue, [handler] + console)
+            self.listener.start()
+            atexit.register(self.listener.stop)
+
+            root.setLevel(config.LOG_LEVEL)
+            root.addHandler(FastQueueHandler(log_queue))
+            for item in config.LOG_LEVELS.split(','):
+                name, _, level = item.partition('=')
+                if name and level:
+                    logging.getLogger(name.strip()).setLevel(level.strip().upper())
             logging.info(msg='Opening downloader')
 
         def critical(self, msg):
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+
+from core import config
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+"""
+
+
+class MediaStore:
+    class __MediaStore:
+        """
+        Blobs are saved once in `<store>/blobs/<hash[:2]>/<hash>` and linked into each project folder,
+        the `<store>/urls.db` sqlite table maps every downloaded url to its blob hash
+        """
+
+        def __init__(self, path):
+            self.path = path
+            self.blobs_path = os.path.join(path, 'blobs')
+            self.lock = threading.Lock()
+            os.makedirs(self.blobs_path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(path, 'urls.db'), timeout=30, check_same_thread=False)
+            # batch workers share the store, a lost last write only costs a download
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+
+        def blob_path(self, digest):
+            return os.path.join(self.blobs_path, digest[:2], digest)
+
+        def lookup(self, url):
+            """Return the blob already stored for `url`, or None"""
+            with self.lock:
+                row = self.connection.execute('SELECT digest FROM urls WHERE url = ?', (url,)).fetchone()
+            digest = row[0] if row else None
+            if digest and os.path.exists(self.blob_path(digest)):
+                return self.blob_path(digest)
+            return None
+
+        def add(self, url, filename):
+            """Move `filename` into the store, replace it with a link to the blob and remember `url`"""
+            digest = hash_file(filename)
+            blob = self.blob_path(digest)
+            with self.lock, self.connection:
+                if os.path.exists(blob):
+                    os.remove(filename)
+                else:
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    shutil.move(filename, blob)
+                self.connection.execute('INSERT OR REPLACE INTO urls VALUES (?, ?)', (url, digest))
+            link(blob, filename)
+            return digest
+
+    instance = None
+    # the stages of the first project ask for it at the same time, only one may open the database
+    lock = threading.Lock()
+
+    def __new__(cls):
+        if not MediaStore.instance:
+            with MediaStore.lock:
+                if not MediaStore.instance:
+                    MediaStore.instance = MediaStore.__MediaStore(config.MEDIA_STORE_PATH)
+        return MediaStore.instance
+
+
+def hash_file(filename, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for data in iter(lambda: f.read(chunk_size), b''):
+            sha.update(data)
+    return sha.hexdigest()
+
+
+def link(blob, filename):
+    """Hardlink `blob` to `filename`, copy it when links are not supported (FAT, other drive)"""
+    if os.path.exists(filename):
+        os.remove(filename)
+    try:
+        os.link(blob, filename)
+    except OSError:
+        shutil.copyfile(blob, filename)
@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import threading
+import time
+
+from core import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    slug TEXT PRIMARY KEY,
+    id INTEGER,
+    name TEXT,
+    state TEXT,
+    country TEXT,
+    creator TEXT,
+    deadline INTEGER,
+    data TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS projects_state ON projects (state);
+CREATE INDEX IF NOT EXISTS projects_country ON projects (country);
+CREATE INDEX IF NOT EXISTS projects_creator ON projects (creator);
+CREATE INDEX IF NOT EXISTS projects_deadline ON projects (deadline);
+CREATE TABLE IF NOT EXISTS project_snapshots (
+    slug TEXT NOT NULL,
+    scraped_at INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS project_snapshots_slug ON project_snapshots (slug, scraped_at);
+CREATE TABLE IF NOT EXISTS creators (
+    profile TEXT PRIMARY KEY,
+    name TEXT,
+    data TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+UPSERT_PROJECT = """
+INSERT INTO projects (slug, id, name, state, country, creator, deadline, data, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (slug) DO UPDATE SET id = excluded.id, name = excluded.name, state = excluded.state,
+    country = excluded.country, creator = excluded.creator, deadline = excluded.deadline, data = excluded.data,
+    updated_at = excluded.updated_at
+"""
+
+UPSERT_CREATOR = """
+INSERT INTO creators (profile, name, data, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (profile) DO UPDATE SET name = excluded.name, data = excluded.data, updated_at = excluded.updated_at
+"""
+
+
+class MetadataStore:
+    class __MetadataStore:
+        """
+        Latest info of every project keyed by slug, a snapshot row per scrape and the creators info
+        """
+
+        def __init__(self, path):
+            self.lock = threading.Lock()
+            self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            # batch workers write to the same file from several processes
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(SCHEMA)
+
+        def upsert_projects(self, projects):
+            """
+            Insert or update every `(info, project_id, creator)` tuple, `info` is the build_object_project dict
+            """
+            now = int(time.time())
+            rows = []
+            snapshots = []
+            for info, project_id, creator in projects:
+                data = json.dumps(info)
+                rows.append((info['slug'], project_id, info['name'], info['state'], info['country'], creator,
+                             info['deadline'], data, now))
+                snapshots.append((info['slug'], now, data))
+            with self.lock, self.connection:
+                self.connection.executemany(UPSERT_PROJECT, rows)
+                self.connection.executemany('INSERT INTO project_snapshots VALUES (?, ?, ?)', snapshots)
+
+        def upsert_creator(self, creator_info):
+            with self.lock, self.connection:
+                self.connection.execute(UPSERT_CREATOR, (creator_info['profile'], creator_info['name'],
+                                                         json.dumps(creator_info), int(time.time())))
+
+        def query(self, sql, params=()):
+            with self.lock:
+                return self.connection.execute(sql, params).fetchall()
+
+        def export_jsonl(self, filename, table='projects'):
+            """Write the `data` column of `table` (projects, project_snapshots or creators) one json per line"""
+            count = 0
+            with self.lock, open(filename, 'w') as f:
+                for (data,) in self.connection.execute('SELECT data FROM ' + table):
+                    f.write(data + '\n')
+                    count += 1
+            return count
+
+        def close(self):
+            with self.lock:
+                self.connection.close()
+
+    instance = None
+
+    def __new__(cls):
+        if not MetadataStore.instance:
+            MetadataStore.instance = MetadataStore.__MetadataStore(config.METADATA_DB_PATH)
+        return MetadataStore.instance
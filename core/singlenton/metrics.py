@@ -0,0 +1,108 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# registry of the job running in the current context, every series is also recorded in it
+current_scope = contextvars.ContextVar('metrics_scope', default=None)
+
+
+class Metrics:
+    class __Metrics:
+        """
+        Process wide counters and timers, every series is identified by a name and optional labels
+        A series recorded inside Metrics.scope() is also added to the registry of that scope
+        """
+
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.counters = {}
+            self.timers = {}
+
+        def inc(self, name, value=1, **labels):
+            key = series_key(name, labels)
+            with self.lock:
+                self.counters[key] = self.counters.get(key, 0) + value
+            scope = current_scope.get()
+            if scope is not None and scope is not self:
+                scope.inc(name, value, **labels)
+
+        def observe(self, name, seconds, **labels):
+            key = series_key(name, labels)
+            with self.lock:
+                timer = self.timers.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0})
+                timer['count'] += 1
+                timer['sum'] += seconds
+                timer['max'] = max(timer['max'], seconds)
+            scope = current_scope.get()
+            if scope is not None and scope is not self:
+                scope.observe(name, seconds, **labels)
+
+        @contextmanager
+        def timer(self, name, **labels):
+            start = time.time()
+            try:
+                yield
+            finally:
+                self.observe(name, time.time() - start, **labels)
+
+        def snapshot(self):
+            with self.lock:
+                return {'counters': dict(self.counters),
+                        'timers': {key: dict(value) for key, value in self.timers.items()}}
+
+        def write_json(self, filename, data):
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+            with open(filename, 'w') as f:
+                json.dump(data, f, indent=2)
+
+        def write_prometheus(self, filename):
+            """Write every series in the Prometheus text exposition format"""
+            data = self.snapshot()
+            lines = []
+            for key, value in sorted(data['counters'].items()):
+                lines.append(prometheus_series(key, '_total') + ' ' + str(value))
+            for key, value in sorted(data['timers'].items()):
+                lines.append(prometheus_series(key, '_seconds_count') + ' ' + str(value['count']))
+                lines.append(prometheus_series(key, '_seconds_sum') + ' ' + '%.6f' % value['sum'])
+                lines.append(prometheus_series(key, '_seconds_max') + ' ' + '%.6f' % value['max'])
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+            tmp = filename + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(tmp, filename)
+
+    instance = None
+
+    def __new__(cls):
+        if not Metrics.instance:
+            Metrics.instance = Metrics.__Metrics()
+        return Metrics.instance
+
+    @staticmethod
+    @contextmanager
+    def scope():
+        """
+        Yields a registry holding only what this context records, e.g. the downloads and API calls of one
+        project while other jobs run in the same process. Threads started with a ContextExecutor inherit it
+        """
+        registry = Metrics.__Metrics()
+        token = current_scope.set(registry)
+        try:
+            yield registry
+        finally:
+            current_scope.reset(token)
+
+
+def series_key(name, labels):
+    """`name{a="1",b="2"}`, also used as the json key"""
+    if not labels:
+        return name
+    return name + '{' + ','.join('%s="%s"' % (k, labels[k]) for k in sorted(labels)) + '}'
+
+
+def prometheus_series(key, suffix):
+    name, _, labels = key.partition('{')
+    return 'kickstarter_' + name + suffix + ('{' + labels if labels else '')
@@ -1,4 +1,5 @@
 import os
+import threading
 
 from selenium import webdriver
 
@@ -6,29 +7,45 @@ from core.singlenton.app_path import AppPath
 from core.singlenton.logger import Logger
 
 
+def create_driver(headless=False, start_url='https://www.kickstarter.com/'):
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless")
+        options.add_argument("--window-size=1920,1080")
+    else:
+        options.add_argument("--start-maximized")
+    driver_path = os.path.abspath(AppPath() + '//driver//chromedriver.exe')
+    driver = webdriver.Chrome(executable_path=driver_path, chrome_options=options)
+    if start_url:
+        driver.get(start_url)
+    return driver
+
+
 class WebDriver:
     class __WebDriver:
         def __init__(self):
-            self.options = webdriver.ChromeOptions()
-            self.options.add_argument("--start-maximized")
-            # self.options.add_argument("--headless")
-            # self.options.headless = True
-            self.driver_path = os.path.abspath(AppPath.path + '//driver//chromedriver.exe')
-            self.driver = webdriver.Chrome(executable_path=self.driver_path, chrome_options=self.options)
-            self.driver.get('https://www.kickstarter.com/')
-
-    def close_webdriver(self):
-        print('close chrome')
-        self.driver.quit()
+            self.driver = create_driver()
+
+    @staticmethod
+    def close_webdriver():
+        with WebDriver.lock:
+            if WebDriver.driver:
+                print('close chrome')
+                WebDriver.driver.quit()
+                WebDriver.driver = None
 
     driver = None
+    # the GUI starts Chrome in the background while a Download click can ask for it, only one may launch it
+    lock = threading.Lock()
 
     def __new__(cls):
         if not WebDriver.driver:
-            try:
-                WebDriver.driver = WebDriver.__WebDriver().driver
-            except Exception as e:
-                Logger().error('ERROR Starting webdriver')
-                Logger().error(str(e))
+            with WebDriver.lock:
+                if not WebDriver.driver:
+                    try:
+                        WebDriver.driver = WebDriver.__WebDriver().driver
+                    except Exception as e:
+                        Logger().error('ERROR Starting webdriver')
+                        Logger().error(str(e))
 
         return WebDriver.driver
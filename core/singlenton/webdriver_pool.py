@@ -0,0 +1,134 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+from core import config
+from core.singlenton.logger import Logger
+from core.singlenton.webdriver import create_driver
+
+
+class WebDriverPool:
+    class __WebDriverPool:
+        """
+        Up to `size` Chrome instances leased with acquire / release (or the `lease()` context manager),
+        a driver that fails the health check or served `max_pages` pages is quit and replaced
+        """
+
+        def __init__(self, size, max_pages, headless):
+            self.size = size
+            self.max_pages = max_pages
+            self.headless = headless
+            self.idle = []
+            self.leased = set()
+            self.pages = {}
+            self.created = 0
+            self.closed = False
+            # guards idle, leased, pages, created and closed, notified whenever a driver is released or discarded
+            self.available = threading.Condition()
+
+        def acquire(self, timeout=None):
+            """Return a healthy driver, waits `timeout` seconds (forever when None) when every driver is leased"""
+            while True:
+                driver = self.take_or_create(timeout)
+                if self.healthy(driver):
+                    return driver
+                Logger().warn('Discarding unhealthy webdriver')
+                self.discard(driver)
+
+        def take_or_create(self, timeout):
+            with self.available:
+                if not self.available.wait_for(lambda: self.closed or self.idle or self.created < self.size,
+                                               timeout):
+                    raise queue.Empty
+                if self.closed:
+                    raise WebDriverException('The webdriver pool is closed')
+                if self.idle:
+                    driver = self.idle.pop()
+                    self.leased.add(driver)
+                    return driver
+                self.created += 1
+            try:
+                driver = create_driver(headless=self.headless, start_url=None)
+            except Exception:
+                with self.available:
+                    self.created -= 1
+                    self.available.notify()
+                raise
+            with self.available:
+                self.pages[driver] = 0
+                self.leased.add(driver)
+                closed = self.closed
+            if closed:
+                # close() ran while Chrome was starting
+                self.discard(driver)
+                raise WebDriverException('The webdriver pool is closed')
+            return driver
+
+        def release(self, driver):
+            with self.available:
+                if driver not in self.leased:
+                    # already quit by close()
+                    return
+                pages = self.pages[driver] = self.pages.get(driver, 0) + 1
+                closed = self.closed
+                if not closed and pages < self.max_pages:
+                    self.leased.discard(driver)
+                    self.idle.append(driver)
+                    self.available.notify()
+                    return
+            if not closed:
+                Logger().info('Recycling webdriver after ' + str(pages) + ' pages')
+            self.discard(driver)
+
+        @contextmanager
+        def lease(self, timeout=None):
+            driver = self.acquire(timeout)
+            try:
+                yield driver
+            finally:
+                self.release(driver)
+
+        def healthy(self, driver):
+            try:
+                return driver.execute_script('return 1;') == 1
+            except WebDriverException:
+                return False
+
+        def discard(self, driver):
+            with self.available:
+                self.pages.pop(driver, None)
+                self.leased.discard(driver)
+                self.created -= 1
+                # a waiter can start a new driver in its place
+                self.available.notify()
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+        def close(self):
+            """Quit every driver, idle or leased, a page still using a leased one fails instead of leaking Chrome"""
+            with self.available:
+                self.closed = True
+                drivers = self.idle + list(self.leased)
+                self.idle = []
+                self.available.notify_all()
+            for driver in drivers:
+                self.discard(driver)
+
+    instance = None
+
+    def __new__(cls):
+        if not WebDriverPool.instance:
+            WebDriverPool.instance = WebDriverPool.__WebDriverPool(config.WEBDRIVER_POOL_SIZE,
+                                                                   config.WEBDRIVER_MAX_PAGES,
+                                                                   config.WEBDRIVER_HEADLESS)
+        return WebDriverPool.instance
+
+    @staticmethod
+    def shutdown():
+        if WebDriverPool.instance:
+            WebDriverPool.instance.close()
+            WebDriverPool.instance = None
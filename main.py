@@ -1,22 +1,22 @@
-import datetime
-import logging
-import queue
-import re
-import signal
-import threading
 import time
-import tkinter as tk
-from tkinter import ttk, VERTICAL, HORIZONTAL, N, S, E, W
-from tkinter.scrolledtext import ScrolledText
 
-from selenium.common.exceptions import WebDriverException
+STARTED = time.perf_counter()
 
-from core.downloader import get_all_media, get_all_thumbnails, download_file
-from core.kickstarter_service import get_project_info, get_creator_info
-from core.notification.notification import NotificationManager
-from core.page_scrap import PageScrap
-from core.singlenton.app_path import AppPath
-from core.singlenton.webdriver import WebDriver
+import datetime  # noqa: E402
+import logging  # noqa: E402
+import queue  # noqa: E402
+import signal  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import tkinter as tk  # noqa: E402
+from tkinter import ttk, filedialog, VERTICAL, HORIZONTAL, N, S, E, W  # noqa: E402
+from tkinter.scrolledtext import ScrolledText  # noqa: E402
+
+from core import config  # noqa: E402
+from core.scheduler import JobScheduler, FINISHED, DONE  # noqa: E402
+from core.singlenton.app_path import AppPath  # noqa: E402
+
+# selenium, requests, tqdm and pytweening are only imported by the core modules loaded on first use
 
 logger = logging.getLogger(__name__)
 
@@ -83,139 +83,110 @@ class ConsoleUi:
         formatter = logging.Formatter('%(asctime)s: %(message)s')
         self.queue_handler.setFormatter(formatter)
         logger.addHandler(self.queue_handler)
+        logging.getLogger('core.project').addHandler(self.queue_handler)
+        logging.getLogger('core.scheduler').addHandler(self.queue_handler)
         # Start polling messages from the queue
         self.frame.after(100, self.poll_log_queue)
 
-    def display(self, record):
-        msg = self.queue_handler.format(record)
+    def display(self, records):
+        """Insert every record with a single widget call and keep only the last CONSOLE_MAX_LINES lines"""
+        chunks = []
+        for record in records:
+            chunks += [self.queue_handler.format(record) + '\n', record.levelname]
         self.scrolled_text.configure(state='normal')
-        self.scrolled_text.insert(tk.END, msg + '\n', record.levelname)
+        self.scrolled_text.insert(tk.END, *chunks)
+        lines = int(self.scrolled_text.index('end-1c').split('.')[0]) - 1
+        if lines > config.CONSOLE_MAX_LINES:
+            self.scrolled_text.delete('1.0', '%d.0' % (lines - config.CONSOLE_MAX_LINES + 1))
         self.scrolled_text.configure(state='disabled')
         # Autoscroll to the bottom
         self.scrolled_text.yview(tk.END)
 
     def poll_log_queue(self):
-        # Check every 100ms if there is a new message in the queue to display
-        while True:
+        # Check every 100ms if there are new messages in the queue to display, a burst is rendered
+        # over several ticks so the Tk main loop never blocks on it
+        skipped = 0
+        # records that would scroll out of the capped widget anyway are never rendered
+        while self.log_queue.qsize() > config.CONSOLE_MAX_LINES:
             try:
-                record = self.log_queue.get(block=False)
-                print(record)
+                self.log_queue.get(block=False)
+                skipped += 1
             except queue.Empty:
                 break
-            else:
-                self.display(record)
-        self.frame.after(100, self.poll_log_queue)
+        if skipped:
+            logger.warning('%d log lines skipped in the console, see downloader.log' % skipped)
+        records = []
+        deadline = time.time() + config.CONSOLE_TICK_BUDGET
+        while len(records) < config.CONSOLE_MAX_RECORDS and time.time() < deadline:
+            try:
+                records.append(self.log_queue.get(block=False))
+            except queue.Empty:
+                break
+        if records:
+            self.display(records)
+        self.frame.after(10 if not self.log_queue.empty() else 100, self.poll_log_queue)
+
+
+class JobsUi:
+    """Show the queue depth and the status of every scheduled job, refreshed every 500ms"""
 
+    columns = ('project', 'status', 'images', 'videos', 'seconds')
 
-def process_url(url: str):
-    routes = ['/description', '/faqs', '/posts', '/comments', '/community']
-    for route in routes:
-        url = url.replace(route, '')
-    return url
-
-
-def is_valid_url(url):
-    # Regex to check valid URL
-    regex = ("((http|https)://)(www.)?" +
-             "[a-zA-Z0-9@:%._\\+~#?&//=]" +
-             "{2,256}\\.[a-z]" +
-             "{2,6}\\b([-a-zA-Z0-9@:%" +
-             "._\\+~#?&//=]*)")
-
-    # Compile the ReGex
-    p = re.compile(regex)
-
-    # If the string is empty
-    # return false
-    if url is None:
-        return False
-
-    # Return if the string
-    # matched the ReGex
-    if re.search(p, url):
-        return True
-    else:
-        return False
-
-
-def build_object_project(project):
-    return {
-        "name": project['name'],
-        "blurb": project['blurb'],
-        "goal": project['goal'],
-        "pledged": project['pledged'],
-        "state": project['state'],
-        "slug": project['slug'],
-        "disable_communication": project['disable_communication'],
-        "country": project['country'],
-        "country_displayable_name": project['country_displayable_name'],
-        "currency": project['currency'],
-        "currency_symbol": project['currency_symbol'],
-        "currency_trailing_code": project['currency_trailing_code'],
-        "deadline": project['deadline'],
-        "state_changed_at": project['state_changed_at'],
-        "created_at": project['created_at'],
-        "launched_at": project['launched_at'],
-        "staff_pick": project['staff_pick'],
-        "is_starrable": project['is_starrable'],
-        "backers_count": project['backers_count'],
-        "static_usd_rate": project['static_usd_rate'],
-        "usd_pledged": project['usd_pledged'],
-        "converted_pledged_amount": project['converted_pledged_amount'],
-        "fx_rate": project['fx_rate'],
-        "current_currency": project['current_currency'],
-        "usd_type": project['usd_type'],
-    }
-
-
-def get_project_id(url):
-    project_id = process_url(url).split('?')[0].split('/')[-1]
-    logger.info(project_id.upper())
-    return project_id
-
-
-def download_creator_info(project, path):
-    logger.info("Downloading creator info")
-    try:
-        creator_api_url = project["creator"]["urls"]["api"]['user']
-        creator = get_creator_info(creator_api_url)
-        logger.info("Creator is " + creator["name"] + ", generating info...")
-        creator_info = {
-            "name": creator["name"],
-            "profile": creator["urls"]["web"]["user"],
-            "biography": creator["biography"],
-            "links": PageScrap().get_creator_links()
-        }
-        logger.info("Downloading " + creator["name"] + " thumbnails...")
-        get_all_thumbnails(creator['avatar'], path + 'creator\\avatar')
-        logger.info("Thumbnails downloaded...")
-        download_file(path + "creator\\", creator_info, "creator-info.txt")
-        print(creator)
-    except Exception as e:
-        logger.error("Error getting creator info ->" + str(e))
-
-
-def download_project_info(project_id, path):
-    logger.info(msg='Searching project ' + project_id + 'info in Kickstarter')
-    project_json = get_project_info(project_id)
-    if project_json is not None and len(project_json['projects']) > 0:
-        project = project_json['projects'][0]
-        logging.info(msg='Download project info')
-        download_file(path, build_object_project(project), "project-info.txt")
-        logging.info(msg='Project info downloaded')
-        logger.info('Searching project thumbnails...')
-        get_all_thumbnails(project['photo'], path + 'video\\thumbnails')
-        logger.info('Thumbnails downloaded')
-        download_creator_info(project, path)
-    else:
-        logger.error('Kickstarter project not found')
+    def __init__(self, frame, scheduler, on_finished):
+        self.frame = frame
+        self.scheduler = scheduler
+        self.on_finished = on_finished
+        self.notified = set()
+        self.depth_label = ttk.Label(frame, text='')
+        self.depth_label.grid(row=0, column=0, sticky=W)
+        self.tree = ttk.Treeview(frame, columns=self.columns, show='headings', height=6)
+        for column in self.columns:
+            self.tree.heading(column, text=column.capitalize())
+            self.tree.column(column, width=70 if column != 'project' else 260, anchor=W)
+        self.tree.grid(row=1, column=0, sticky=(N, S, W, E))
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(1, weight=1)
+        self.frame.after(500, self.poll_jobs)
+
+    def selected(self):
+        return [int(item) for item in self.tree.selection()]
+
+    def poll_jobs(self):
+        jobs = self.scheduler.snapshot()
+        shown = set(self.tree.get_children())
+        for job in jobs:
+            summary = job.summary or {}
+            values = (summary.get('project_id') or job.url, job.status, summary.get('images', ''),
+                      summary.get('videos', ''), summary.get('seconds', ''))
+            if str(job.id) in shown:
+                self.tree.item(str(job.id), values=values)
+            else:
+                self.tree.insert('', tk.END, iid=str(job.id), values=values)
+            if job.status in FINISHED and job.id not in self.notified:
+                self.notified.add(job.id)
+                self.on_finished(job)
+        for item in shown - set(str(job.id) for job in jobs):
+            self.tree.delete(item)
+        self.depth_label['text'] = '%d queued, %d running' % (self.scheduler.depth(), self.scheduler.running())
+        self.frame.after(500, self.poll_jobs)
 
 
 class App:
-    notification_manager = NotificationManager(background="white")
     workspace = AppPath()
-    webdriver = WebDriver()
-    scraper = PageScrap()
+    _notification_manager = None
+
+    @property
+    def notification_manager(self):
+        if self._notification_manager is None:
+            from core.notification.notification import NotificationManager
+            self._notification_manager = NotificationManager(background="white")
+        return self._notification_manager
+
+    @property
+    def webdriver(self):
+        # the singleton launches Chrome on the first call
+        from core.singlenton.webdriver import WebDriver
+        return WebDriver()
 
     def __init__(self, root):
         self.root = root
@@ -237,75 +208,89 @@ class App:
         vertical_pane.add(third_frame, weight=1)
         self.button = ttk.Button(third_frame, text='Download', command=lambda: self.fetch())
         self.button.grid(column=1, row=0, sticky=W)
+        ttk.Button(third_frame, text='Load list...', command=self.load_list).grid(column=2, row=0, sticky=W)
+        ttk.Button(third_frame, text='Cancel', command=self.cancel).grid(column=3, row=0, sticky=W)
+        ttk.Button(third_frame, text='Clear finished', command=self.clear_finished).grid(column=4, row=0, sticky=W)
+        jobs_frame = ttk.Frame(third_frame)
+        jobs_frame.grid(column=0, row=1, columnspan=5, sticky=(N, S, W, E))
+        third_frame.columnconfigure(0, weight=1)
+        third_frame.rowconfigure(1, weight=1)
 
         # Initialize all frames
         self.console = ConsoleUi(console_frame)
+        # every download is a job, the scheduler runs SCHEDULER_WORKERS of them at a time
+        self.scheduler = JobScheduler()
+        self.jobs = JobsUi(jobs_frame, self.scheduler, self.job_finished)
         self.clock = Clock()
         self.clock.start()
         self.root.protocol('WM_DELETE_WINDOW', self.quit)
         self.root.bind('<Control-q>', self.quit)
         signal.signal(signal.SIGINT, self.quit)
+        # Chrome starts once the window is on screen, the user navigates to the project in it
+        self.root.after_idle(self.ready)
 
-    def fetch(self):
-        th = threading.Thread(target=self.download)
-        th.start()
+    def ready(self):
+        logger.info('Window ready in %.2fs' % (time.perf_counter() - STARTED))
+        threading.Thread(target=self.start_browser, daemon=True).start()
 
-    def close(self):
-        self.webdriver.quit()
-        self.root.quit()
+    def start_browser(self):
+        start = time.perf_counter()
+        if self.webdriver is not None:
+            logger.info('Chrome ready in %.2fs' % (time.perf_counter() - start))
+
+    def fetch(self):
+        # reading the url waits for Chrome, the job itself runs on the scheduler
+        threading.Thread(target=self.queue_current_project, daemon=True).start()
 
-    def download(self):
+    def queue_current_project(self):
+        from core.project import is_valid_url
         try:
             url = self.webdriver.current_url
-            logger.info(url)
-            if is_valid_url(url) and url.startswith("https://www.kickstarter.com/projects/"):
-                project_id = get_project_id(url)
-                path = self.get_project_path(project_id)
-                self.button['state'] = tk.DISABLED
-                self.button['text'] = 'Downloading...'
-                logger.info('Starting web scraping for project ' + project_id)
-                logger.info('Starting image scraping ')
-                self.download_images(path)
-                logger.info('Starting video scraping ')
-                self.download_videos(path)
-                download_project_info(project_id, path)
-                logger.info('Download successfully ')
-                self.button['state'] = tk.NORMAL
-                self.button['text'] = 'Download'
-                self.create_notification(5, 'Project downloaded successfully')
-            else:
-                logger.error('Invalid Kickstarter project url ')
         except Exception:
             logger.error(msg='Unable to connect with Chrome browser, please install')
+            return
+        logger.info(url)
+        if is_valid_url(url) and url.startswith("https://www.kickstarter.com/projects/"):
+            self.scheduler.submit(url)
+        else:
+            logger.error('Invalid Kickstarter project url ')
+
+    def load_list(self):
+        filename = filedialog.askopenfilename(title='Project urls, one per line',
+                                              filetypes=[('Text files', '*.txt'), ('All files', '*.*')])
+        if filename:
+            jobs = self.scheduler.submit_file(filename)
+            logger.info(str(len(jobs)) + ' projects queued from ' + filename)
+
+    def cancel(self):
+        for job_id in self.jobs.selected():
+            self.scheduler.cancel(job_id)
+
+    def clear_finished(self):
+        self.scheduler.clear_finished()
+
+    def job_finished(self, job):
+        if job.status == DONE:
+            self.create_notification(5, 'Project ' + job.summary['project_id'] + ' downloaded successfully')
 
-    def download_images(self, path):
-        logger.info(msg='Init project images download')
-        images_content = PageScrap().get_all_images()
-        try:
-            if images_content is not None:
-                logger.info(msg='Found ' + str(len(images_content)) + ' images, starting download')
-                get_all_media(images_content, path, '', 'images')
-                logger.info(msg='Project images downloaded successfully')
-        except TypeError as e:
-            logger.error('ERROR getting images from page -> ' + str(e))
-        self.webdriver.execute_script("window.scrollTo(0,0)")
-
-    def download_videos(self, path):
-        logger.info(msg='Init project video download')
-        videos = PageScrap().get_video_links()
-        try:
-            if videos is not None:
-                logger.info(msg='Found ' + str(len(videos)) + ' videos, starting download')
-                get_all_media(videos, path + 'video')
-                logger.info(msg='Project videos downloaded successfully')
-        except TypeError as e:
-            logger.error('ERROR getting videos from page -> ' + str(e))
-        self.webdriver.execute_script("window.scrollTo(0,0)")
-
-    def get_project_path(self, project_id):
-        path = self.workspace + '\\downloads\\' + project_id + '\\'
-        logger.info('Project will save in ' + path)
-        return path
+    def close(self):
+        self.shutdown_services()
+        from core.singlenton.webdriver import WebDriver
+        WebDriver.close_webdriver()
+        self.root.quit()
+
+    def shutdown_services(self):
+        self.scheduler.shutdown(wait=False)
+        # only the services that were actually started, importing them here would load requests for nothing
+        if 'core.singlenton.download_executor' in sys.modules:
+            executor = sys.modules['core.singlenton.download_executor'].DownloadExecutor
+            executor.shutdown(wait=False, cancel_futures=True)
+        if 'core.singlenton.async_loop' in sys.modules:
+            sys.modules['core.singlenton.async_loop'].AsyncLoop.shutdown()
+        if 'core.singlenton.http_session' in sys.modules:
+            sys.modules['core.singlenton.http_session'].HttpSession.close()
+        if 'core.singlenton.webdriver_pool' in sys.modules:
+            sys.modules['core.singlenton.webdriver_pool'].WebDriverPool.shutdown()
 
     def create_notification(self, start_time, text):
         def notify():
@@ -316,8 +301,9 @@ class App:
 
         self.root.after(start_time, notify)
 
-    def quit(self):
+    def quit(self, *args):
         self.clock.stop()
+        self.shutdown_services()
         self.root.destroy()
 
 
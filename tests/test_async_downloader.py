@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.server import BenchmarkServer, BLOCK
+from core import config
+
+# the downloader modules start the logger when imported, keep its file out of the working tree
+config.LOG_FILE = os.path.join(tempfile.gettempdir(), 'ks-tests.log')
+
+from core import async_downloader  # noqa: E402
+from core.singlenton.async_loop import AsyncLoop  # noqa: E402
+from core.singlenton.http_cache import HttpCache  # noqa: E402
+
+SIZE = 200000
+
+
+def content(size):
+    return (BLOCK * (size // len(BLOCK) + 1))[:size]
+
+
+class AsyncDownloaderTest(unittest.TestCase):
+    """core.async_downloader against the local benchmark server"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='ks-test-')
+        self.settings = {name: getattr(config, name) for name in
+                         ('HTTP_CACHE_ENABLED', 'HTTP_CACHE_PATH', 'MEDIA_STORE_ENABLED', 'HOST_MAX_RETRY_AFTER')}
+        config.HTTP_CACHE_ENABLED = True
+        config.HTTP_CACHE_PATH = os.path.join(self.folder, 'cache')
+        config.MEDIA_STORE_ENABLED = False
+        HttpCache.close()
+        self.server = None
+
+    def tearDown(self):
+        AsyncLoop.shutdown()
+        HttpCache.close()
+        if self.server is not None:
+            self.server.stop()
+        for name, value in self.settings.items():
+            setattr(config, name, value)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def start(self, **kwargs):
+        self.server = BenchmarkServer(**kwargs).start()
+        return self.server.file_urls(1, SIZE)[0]
+
+    def download(self, url):
+        # the downloader joins folder and file name with '\\'
+        return async_downloader.submit(url, self.folder + os.sep).result(timeout=30)
+
+    def test_partial_file_is_resumed(self):
+        url = self.start()
+        filename = os.path.join(self.folder, '0-%d.jpg' % SIZE)
+        # bytes the server would not send, a resume keeps them and appends the rest
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'\0' * 1000)
+        result = self.download(url)
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(self.server.ranges, ['bytes=1000-'])
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'\0' * 1000 + content(SIZE)[1000:])
+        self.assertFalse(os.path.exists(filename + '.part'))
+
+    def test_unchanged_file_is_revalidated(self):
+        url = self.start()
+        self.assertEqual(self.download(url)['status'], 'ok')
+        result = self.download(url)
+        self.assertEqual(result['status'], 'not_modified')
+        self.assertEqual(result['bytes'], SIZE)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_throttled_download_is_retried(self):
+        url = self.start(fail_first=2, retry_after='0')
+        result = self.download(url)
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(result['bytes'], SIZE)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_retry_after_past_the_limit_fails(self):
+        config.HOST_MAX_RETRY_AFTER = 60
+        url = self.start(fail_first=1, retry_after='86400')
+        self.assertEqual(self.download(url)['status'], 'error')
+        self.assertEqual(self.server.requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from core.media_urls import ImageFilter, canonicalize, parse_srcset, skipped
+
+# srcset of a Kickstarter project image, imgix signs the query (s=) including auto=format,compress
+BASE = 'https://ksr-ugc.imgix.net/assets/033/514/093/6a1b1c2bb2c5e1d0d3e1_original.jpg'
+SMALL = BASE + '?ixlib=rb-4.0.2&w=680&fit=max&v=1612284393&auto=format,compress&frame=1&q=92&s=3f9c0b3e0b1d4a5c'
+LARGE = BASE + '?ixlib=rb-4.0.2&w=1024&fit=max&v=1612284393&auto=format,compress&frame=1&q=92&s=8e2f5d71c6a4b9e0'
+SRCSET = LARGE + ' 1024w, ' + SMALL + ' 680w'
+
+
+class ParseSrcsetTest(unittest.TestCase):
+
+    def test_commas_inside_urls_are_kept(self):
+        self.assertEqual(parse_srcset(SRCSET), [(LARGE, '1024w'), (SMALL, '680w')])
+
+    def test_candidates_without_descriptor(self):
+        self.assertEqual(parse_srcset('a.jpg, b.jpg 2x'), [('a.jpg', None), ('b.jpg', '2x')])
+
+
+class CanonicalizeTest(unittest.TestCase):
+
+    def test_signed_query_is_untouched(self):
+        self.assertEqual(canonicalize(SMALL), SMALL)
+
+    def test_tracking_params_and_fragment_are_removed(self):
+        self.assertEqual(canonicalize('HTTPS://Ksr.COM/a.jpg?b=1+2&utm_source=x&fbclid=y&c=%20,#top'),
+                         'https://ksr.com/a.jpg?b=1+2&c=%20,')
+
+    def test_inline_images_are_ignored(self):
+        self.assertIsNone(canonicalize('data:image/gif;base64,R0lGODlh'))
+
+
+class ImageFilterTest(unittest.TestCase):
+
+    def test_largest_srcset_variant_keeps_its_signature(self):
+        self.assertEqual(ImageFilter(policy='largest').accept(SMALL, SRCSET), LARGE)
+
+    def test_max_width_policy(self):
+        self.assertEqual(ImageFilter(policy='800').accept(None, SRCSET), SMALL)
+
+    def test_variants_of_an_asset_are_downloaded_once(self):
+        image_filter = ImageFilter()
+        self.assertEqual(image_filter.select([(SMALL, None, None, None), (None, SRCSET, None, None)]), [LARGE])
+
+    def test_skip_patterns_match_whole_names(self):
+        self.assertTrue(skipped('https://example.com/t/pixel.gif'))
+        self.assertTrue(skipped('https://ksr-ugc.imgix.net/assets/009/avatars/z.jpg'))
+        self.assertFalse(skipped('https://ksr-ugc.imgix.net/assets/pixelated-hero.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()